@@ -0,0 +1,563 @@
+import asyncio
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+import aiohttp
+from httpSession import ACCEPT_ENCODING, count
+
+# Default cap on in-flight requests, and on open connections to a single host
+MAX_CONCURRENCY = 100
+MAX_PER_HOST = 50
+REQUEST_TIMEOUT = 60
+
+# Seconds an idle connection is kept open for reuse
+KEEPALIVE_TIMEOUT = 30
+
+# Film URLs waiting between the listing and detail stages of a pipeline (backpressure on listing pages)
+QUEUE_SIZE = 500
+
+# Adaptive concurrency: the crawl starts with INITIAL_CONCURRENCY requests in flight and adjusts
+# between MIN_CONCURRENCY and the engine's cap depending on how Letterboxd responds
+INITIAL_CONCURRENCY = 10
+MIN_CONCURRENCY = 2
+
+# Back off when the smoothed latency climbs past this multiple of the best latency seen so far.
+# The baseline creeps up slowly so a server that is simply slower today doesn't pin us at the minimum
+LATENCY_FACTOR = 2.0
+LATENCY_SMOOTHING = 0.2
+BASELINE_DRIFT = 1.01
+
+# Responses that mean "slow down / try again", and how often a page is retried before giving up
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.0
+MAX_RETRY_DELAY = 60
+
+# Errors raised for a failed fetch (connection problems, timeouts)
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# A downloaded page: requested URL, HTTP status, raw body bytes, response headers and
+# the URL it ended up at after redirects (e.g. a boxd.it short link resolving to the film page).
+# data holds what the stage's extract function pulled out of the body (see CrawlEngine.extract)
+class Page:
+    __slots__ = ('url', 'status', 'body', 'headers', 'final_url', 'data')
+
+    def __init__(self, url, status, body, headers=None, final_url=None):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.final_url = final_url or url
+        self.data = None
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+# Function to normalize a URL for de-duplication: case-insensitive scheme/host, no fragment,
+# no doubled slashes and always a trailing slash (Letterboxd serves /film/x and /film/x/ alike)
+def normalize_url(url):
+    parts = urlsplit(url)
+    path = '/'.join(segment for segment in parts.path.split('/') if segment)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), f"/{path}/" if path else "/", parts.query, ''))
+
+# Function to work out how long to wait before retrying, honouring Retry-After (in seconds) when sent
+def retry_delay(attempt, retry_after=None):
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_RETRY_DELAY)
+    delay = RETRY_BACKOFF * 2 ** attempt
+    return min(delay + random.uniform(0, delay / 2), MAX_RETRY_DELAY)
+
+# AIMD concurrency limiter: one more slot after every window of healthy responses (additive increase),
+# half the slots on 429/5xx, connection errors or rising latency (multiplicative decrease)
+class AdaptiveLimiter:
+    def __init__(self, max_limit, initial_limit=INITIAL_CONCURRENCY, min_limit=MIN_CONCURRENCY):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = max(self.min_limit, min(initial_limit, max_limit))
+        self.peak = self.limit
+        self.in_flight = 0
+        self.waiters = deque()
+        self.completed = 0
+        self.window_successes = 0
+        self.last_decrease = None
+        self.latency = None
+        self.baseline_latency = None
+        self.decreases = 0
+
+    # Slots are handed out first come, first served, so the oldest request (the start of a list) never starves
+    async def __aenter__(self):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+            else:
+                # The slot was handed over just as we got cancelled, pass it on
+                self.in_flight -= 1
+                self.wake()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self.wake()
+
+    # Function to hand free slots to the requests that have waited longest
+    def wake(self):
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    # Function to record a healthy response and its latency in seconds
+    def record(self, latency):
+        self.completed += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        if self.baseline_latency is None:
+            self.baseline_latency = self.latency
+        else:
+            self.baseline_latency = min(self.latency, self.baseline_latency * BASELINE_DRIFT)
+
+        if self.latency > LATENCY_FACTOR * self.baseline_latency:
+            self.decrease()
+            return
+
+        self.window_successes += 1
+        if self.window_successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self.peak = max(self.peak, self.limit)
+            self.window_successes = 0
+            self.wake()
+
+    # Function to record a throttled/failed response (429/5xx or a connection error)
+    def backoff(self):
+        self.completed += 1
+        self.decrease()
+
+    # Function to halve the limit, at most once per window so a burst of errors only counts once
+    def decrease(self):
+        if self.last_decrease is not None and self.completed - self.last_decrease < self.limit:
+            return
+        self.limit = max(self.min_limit, self.limit // 2)
+        self.window_successes = 0
+        self.last_decrease = self.completed
+        self.decreases += 1
+
+# Reorder buffer for pipeline results: items finish in any order but are handed to emit(rank, result)
+# in (page, index) order, where rank is the item's 1-based place in the whole listing. Only results that
+# finish ahead of the next expected position are held, so memory stays small on very long lists.
+# Nothing after a listing page that failed is emitted, its items' ranks are unknown (see stopped_at)
+class OrderedCollector:
+    def __init__(self, page_numbers, emit):
+        self.page_numbers = sorted(page_numbers)
+        self.emit = emit
+        self.page_sizes = {}
+        self.buffer = {}
+        self.page_cursor = 0
+        self.index = 0
+        self.rank = 0
+        self.peak_buffered = 0
+        self.stopped_at = None
+
+    # Function to record how many items a listing page has (None when the page failed)
+    def page_done(self, page_number, item_count):
+        self.page_sizes[page_number] = item_count
+        self.flush()
+
+    # Function to take a finished item, None for an item that has no result
+    def add(self, position, result):
+        self.buffer[tuple(position)] = result
+        self.peak_buffered = max(self.peak_buffered, len(self.buffer))
+        self.flush()
+
+    def skip(self, position):
+        self.add(position, None)
+
+    # Function to emit every item that is next in line
+    def flush(self):
+        while self.page_cursor < len(self.page_numbers):
+            page_number = self.page_numbers[self.page_cursor]
+            if page_number not in self.page_sizes:
+                return
+            if self.page_sizes[page_number] is None:
+                self.stopped_at = page_number
+                return
+            if self.index >= self.page_sizes[page_number]:
+                self.page_cursor += 1
+                self.index = 0
+                continue
+            position = (page_number, self.index)
+            if position not in self.buffer:
+                return
+            result = self.buffer.pop(position)
+            self.rank += 1
+            self.index += 1
+            if result is not None:
+                self.emit(self.rank, result)
+
+    # Function to emit whatever is still held (only left over when pages never reported their size),
+    # unless a failed page came first
+    def close(self):
+        if self.stopped_at is not None:
+            self.buffer.clear()
+            return
+        for position in sorted(self.buffer):
+            result = self.buffer.pop(position)
+            self.rank += 1
+            if result is not None:
+                self.emit(self.rank, result)
+
+# Trace hooks feeding the shared connection/request counters from httpSession
+async def on_connection_created(session, context, params):
+    count('connections')
+
+async def on_request_start(session, context, params):
+    count('requests')
+
+# Shared asyncio crawl engine: one event loop and one aiohttp session, with an adaptive number of
+# requests in flight (never more than the concurrency cap) and retries for throttled/failed pages.
+# With parse_processes > 0 the HTML parsing runs in a pool of worker processes instead of the event loop
+class CrawlEngine:
+    def __init__(self, concurrency=MAX_CONCURRENCY, per_host=MAX_PER_HOST, timeout=REQUEST_TIMEOUT, http_cache=None,
+                 parse_processes=0):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.http_cache = http_cache
+        self.parse_pool = ProcessPoolExecutor(max_workers=parse_processes) if parse_processes else None
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        self.limiter = None
+        self.current_task = None
+        self.retries = 0
+        self.failed_urls = {}
+
+        # Request coalescing: downloads in flight by normalized URL, and parse results already
+        # produced this run by (parse function, normalized URL)
+        self.fetches = {}
+        self.parsed = {}
+        self.coalesced = 0
+        self.reused = 0
+
+        # Pages downloaded ahead of a crawl (e.g. page 1 while counting pages), handed out once by fetch
+        self.primed = {}
+
+    # Function to lazily create the session inside the engine's loop
+    async def get_session(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.per_host,
+                keepalive_timeout=KEEPALIVE_TIMEOUT
+            )
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(on_connection_created)
+            trace_config.on_request_start.append(on_request_start)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Accept-Encoding': ACCEPT_ENCODING},
+                trace_configs=[trace_config]
+            )
+            self.limiter = AdaptiveLimiter(self.concurrency)
+        return self.session
+
+    # Function to download a single page, holding one of the concurrency slots while in flight.
+    # 429/5xx responses and connection errors are retried with backoff; once the retries run out
+    # the last response is returned (or the error raised) and the URL is listed in failed_urls.
+    # With cached=True the page goes through the HTTP cache (when the engine has one): a stored copy
+    # is revalidated with a conditional GET, and a 304 hands back the stored body as a normal 200 page
+    async def download(self, url, cached=False):
+        session = await self.get_session()
+        http_cache = self.http_cache if cached else None
+        entry = http_cache.get(url) if http_cache else None
+        if entry is not None and http_cache.is_fresh(entry):
+            http_cache.touch(url)
+            return Page(url, 200, entry['body'], final_url=entry['final_url'])
+        request_headers = http_cache.conditional_headers(entry) if entry is not None else None
+
+        for attempt in range(MAX_RETRIES + 1):
+            async with self.limiter:
+                started = self.loop.time()
+                try:
+                    async with session.get(url, headers=request_headers) as response:
+                        body = await response.read()
+                        page = Page(url, response.status, body, response.headers, str(response.url))
+                except FETCH_ERRORS as e:
+                    self.limiter.backoff()
+                    if attempt == MAX_RETRIES:
+                        self.failed_urls[url] = repr(e)
+                        raise
+                    delay = retry_delay(attempt)
+                else:
+                    if page.status not in RETRY_STATUSES:
+                        self.limiter.record(self.loop.time() - started)
+                        if http_cache and page.status == 304 and entry is not None:
+                            http_cache.touch(url, revalidated=True)
+                            return Page(url, 200, entry['body'], page.headers, entry['final_url'])
+                        if http_cache and page.ok:
+                            http_cache.put(url, page.body, page.headers, page.final_url)
+                        return page
+                    self.limiter.backoff()
+                    if attempt == MAX_RETRIES:
+                        self.failed_urls[url] = f"HTTP {page.status}"
+                        return page
+                    delay = retry_delay(attempt, page.headers.get('Retry-After'))
+
+            # Wait outside the limiter so the slot goes to a request that can use it
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    # Function to download a page, sharing one download between every concurrent request for the same URL
+    async def fetch(self, url, cached=False):
+        key = normalize_url(url)
+        primed_page = self.primed.pop(key, None)
+        if primed_page is not None:
+            return primed_page if primed_page.url == url else Page(
+                url, primed_page.status, primed_page.body, primed_page.headers, primed_page.final_url)
+
+        task = self.fetches.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.download(url, cached))
+            self.fetches[key] = task
+            task.add_done_callback(lambda done: self.fetches.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller giving up doesn't cancel the download for the others
+        page = await asyncio.shield(task)
+        return page if page.url == url else Page(url, page.status, page.body, page.headers, page.final_url)
+
+    # Function to keep a page that was already downloaded for the next fetch of its URL
+    def prime(self, page):
+        self.primed[normalize_url(page.url)] = page
+
+    # Function to parse a page once per run: a URL that shows up again (the same film on the watched
+    # list and the watchlist, or twice in a list) reuses the earlier result without any request
+    def memoized(self, parse, url):
+        key = (parse, normalize_url(url))
+        if key in self.parsed:
+            self.reused += 1
+            return True, self.parsed[key]
+        return False, None
+
+    def remember(self, parse, url, result):
+        if result is not None:
+            self.parsed[(parse, normalize_url(url))] = result
+        return result
+
+    # Function to run a stage's extract function (bytes in, small picklable result out) on a page and keep
+    # the result in page.data. In the process pool only the body and the extracted values cross processes,
+    # so the event loop keeps downloading while the other cores parse
+    async def extract(self, extract, page):
+        if extract is None:
+            return
+        if self.parse_pool is not None:
+            page.data = await self.loop.run_in_executor(self.parse_pool, extract, page.body)
+        else:
+            page.data = extract(page.body)
+
+    # Function to check a page before parsing it: error pages (404, or 429/5xx after all retries)
+    # have no films in them and would otherwise be parsed as empty pages
+    def usable(self, page):
+        if page.ok:
+            return True
+        self.failed_urls.setdefault(page.url, f"HTTP {page.status}")
+        print(f"Skipping {page.url} (HTTP {page.status})")
+        return False
+
+    # Function to run coroutines as tasks, cancelling the rest as soon as one fails or we get cancelled
+    async def gather(self, coros):
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    # Function to fetch every URL and parse it, results come back in the same order as the URLs.
+    # extract (a module-level function of the page body) runs first, in the parse pool when there is one
+    async def fetch_all(self, urls, parse, cached=False, extract=None):
+        async def fetch_and_parse(url):
+            found, result = self.memoized(parse, url)
+            if found:
+                return result
+            try:
+                page = await self.fetch(url, cached)
+            except FETCH_ERRORS as e:
+                print(f"Error fetching {url}: {e!r}")
+                return None
+            if not self.usable(page):
+                return None
+            await self.extract(extract, page)
+            return self.remember(parse, url, parse(page))
+
+        return await self.gather(fetch_and_parse(url) for url in urls)
+
+    # Function to stream listing pages into detail pages: every URL parse_listing finds is handed to the
+    # detail workers straight away, and each parsed detail page goes to on_result((page, index), result).
+    # lookup(url) can answer an item without fetching it (e.g. from a cache), it returns None on a miss.
+    # page_numbers numbers the listing URLs when they don't simply count from 1 (e.g. a resumed crawl),
+    # and pending holds ((page, index), detail_url) items whose listing page doesn't need fetching again.
+    # With ordered=True listing pages are still fetched concurrently but queued in page order, so results
+    # finish close to list order. on_page(page_number, item_count) reports each listing page (None when
+    # it failed) and on_skip(position) each item without a result, which is what an OrderedCollector needs.
+    # extract_listing/extract_detail fill page.data before the parse callbacks run (see extract).
+    # Returns the set of listing and detail URLs this crawl couldn't get a result for
+    async def stream(self, listing_urls, parse_listing, parse_detail, on_result, lookup=None,
+                     queue_size=QUEUE_SIZE, page_numbers=None, pending=(), ordered=False,
+                     on_page=None, on_skip=None, extract_listing=None, extract_detail=None):
+        queue = asyncio.Queue(maxsize=queue_size)
+        page_numbers = list(page_numbers or range(1, len(listing_urls) + 1))
+        queued = {page_number: asyncio.Event() for page_number in page_numbers}
+        previous_pages = dict(zip(page_numbers[1:], page_numbers))
+        failed = set()
+
+        async def produce(page_number, listing_url):
+            try:
+                detail_urls = None
+                try:
+                    page = await self.fetch(listing_url, cached=True)
+                    if self.usable(page):
+                        await self.extract(extract_listing, page)
+                        detail_urls = parse_listing(page) or []
+                except FETCH_ERRORS as e:
+                    print(f"Error fetching {listing_url}: {e!r}")
+                if detail_urls is None:
+                    failed.add(listing_url)
+
+                # Wait for the previous page to be queued first when the order matters
+                if ordered and page_number in previous_pages:
+                    await queued[previous_pages[page_number]].wait()
+                if on_page:
+                    on_page(page_number, None if detail_urls is None else len(detail_urls))
+                for index, detail_url in enumerate(detail_urls or []):
+                    # Blocks while the detail workers are behind, so listing pages never run far ahead
+                    await queue.put(((page_number, index), detail_url))
+            finally:
+                queued[page_number].set()
+
+        async def produce_pending():
+            for position, detail_url in pending:
+                await queue.put((position, detail_url))
+
+        async def consume():
+            while True:
+                position, detail_url = await queue.get()
+                result = None
+                try:
+                    found, result = self.memoized(parse_detail, detail_url)
+                    if not found:
+                        result = lookup(detail_url) if lookup else None
+                    if result is None:
+                        page = await self.fetch(detail_url)
+                        if self.usable(page):
+                            await self.extract(extract_detail, page)
+                            result = self.remember(parse_detail, detail_url, parse_detail(page))
+                    if result is not None:
+                        on_result(position, result)
+                except FETCH_ERRORS as e:
+                    print(f"Error fetching {detail_url}: {e!r}")
+                except Exception as e:
+                    # Keep the worker alive, otherwise queue.join() would wait forever for its items
+                    print(f"Error processing {detail_url}: {e!r}")
+                    result = None
+                finally:
+                    if result is None:
+                        failed.add(detail_url)
+                        if on_skip:
+                            on_skip(position)
+                    queue.task_done()
+
+        workers = [asyncio.ensure_future(consume()) for _ in range(self.concurrency)]
+        try:
+            producers = [produce(page_number, url) for page_number, url in zip(page_numbers, listing_urls)]
+            await self.gather([produce_pending()] + producers)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return failed
+
+    # Function to run a coroutine to completion on the engine's loop (Ctrl+C cancels everything in flight)
+    def run(self, coro):
+        self.current_task = self.loop.create_task(coro)
+        try:
+            return self.loop.run_until_complete(self.current_task)
+        except BaseException:
+            self.current_task.cancel()
+            self.loop.run_until_complete(asyncio.gather(self.current_task, return_exceptions=True))
+
+            # Shared downloads are shielded from their callers, stop the ones nobody is waiting for now
+            downloads = list(self.fetches.values())
+            if downloads:
+                for download in downloads:
+                    download.cancel()
+                self.loop.run_until_complete(asyncio.gather(*downloads, return_exceptions=True))
+            raise
+        finally:
+            self.current_task = None
+
+    # Function to cancel the crawl that is currently running (safe to call from another thread)
+    def cancel(self):
+        task = self.current_task
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    # Blocking helpers for the scripts
+    def get(self, url, cached=False):
+        return self.run(self.fetch(url, cached))
+
+    def map(self, urls, parse, cached=False, extract=None):
+        return self.run(self.fetch_all(urls, parse, cached, extract))
+
+    def pipeline(self, listing_urls, parse_listing, parse_detail, on_result, lookup=None,
+                 queue_size=QUEUE_SIZE, page_numbers=None, pending=(), ordered=False,
+                 on_page=None, on_skip=None, extract_listing=None, extract_detail=None):
+        return self.run(self.stream(listing_urls, parse_listing, parse_detail, on_result, lookup,
+                                    queue_size, page_numbers, pending, ordered, on_page, on_skip,
+                                    extract_listing, extract_detail))
+
+    # Function to print the concurrency the crawl settled on, retries and the pages that failed for good
+    def report(self):
+        if self.http_cache is not None:
+            self.http_cache.report()
+        if self.coalesced or self.reused:
+            print(f"- Duplicate URLs: {self.coalesced + self.reused} requests saved "
+                  f"({self.coalesced} shared while in flight, {self.reused} parse results reused)")
+        if self.limiter is None:
+            return
+        print(f"- Crawl: settled at {self.limiter.limit} requests in flight (peak {self.limiter.peak}, "
+              f"cap {self.concurrency}), {self.limiter.decreases} backoffs, {self.retries} retries")
+        if self.failed_urls:
+            print(f"- {len(self.failed_urls)} pages failed:")
+            for url, reason in self.failed_urls.items():
+                print(f"  {url} ({reason})")
+
+    def close(self):
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+            self.session = None
+        if self.http_cache is not None:
+            self.http_cache.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(cancel_futures=True)
+        self.loop.close()
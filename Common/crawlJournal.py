@@ -0,0 +1,83 @@
+import json
+import os
+
+# Function to name the journal kept next to a CSV while it is being crawled (list.csv -> list_journal.jsonl)
+def journal_path(csv_file):
+    return os.path.splitext(csv_file)[0] + "_journal.jsonl"
+
+# Append-only crawl journal (JSON lines): a header saying what is being crawled, then one record per
+# finished listing page and one per resolved film, flushed as soon as it is written. A crawl that dies
+# can be resumed from it, and the final CSV is streamed back out of it instead of being held in memory
+class CrawlJournal:
+    def __init__(self, path, target):
+        self.path = path
+        self.target = target
+        self.file = None
+        self.pages = {}
+        self.resolved = set()
+
+    # Function to read the records back, skipping a last line that was cut off by a crash
+    def records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    # Function to check whether an unfinished crawl of the same target was left behind
+    def can_resume(self):
+        for record in self.records():
+            return record.get('type') == 'start' and record.get('target') == self.target
+        return False
+
+    # Function to start writing, either after the previous records (resume) or from scratch.
+    # When resuming, pages holds {page number: entries} and resolved the film URLs already done
+    def open(self, resume=False):
+        if resume:
+            for record in self.records():
+                if record['type'] == 'page':
+                    self.pages[record['page']] = record['entries']
+                elif record['type'] == 'film':
+                    self.resolved.add(record['url'])
+            self.file = open(self.path, 'a')
+
+            # Finish a line that was cut off, so the next record starts on a line of its own
+            if self.file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self.file.write('\n')
+        else:
+            self.file = open(self.path, 'w')
+            self.write({'type': 'start', 'target': self.target})
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    # Function to record a parsed listing page and its [movie URL, rating] entries
+    def add_page(self, page_number, entries):
+        self.write({'type': 'page', 'page': page_number, 'entries': entries})
+
+    # Function to record a resolved film (fields are whatever the script needs to write its CSV row)
+    def add_film(self, movie_url, **fields):
+        self.write({'type': 'film', 'url': movie_url, **fields})
+
+    # Function to stream the resolved films back, once per film
+    def films(self):
+        seen = set()
+        for record in self.records():
+            if record['type'] == 'film' and record['url'] not in seen:
+                seen.add(record['url'])
+                yield record
+
+    # Function to close the journal, deleting it once everything it tracked made it into the CSV
+    def close(self, finished=True):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if finished and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+from lbCache import CACHE_DIR
+
+# Seconds a stored page is used as-is before it has to be revalidated (0 = always revalidate, which
+# still only costs a 304 without a body when the page hasn't changed)
+HTTP_CACHE_TTL = 0
+
+# Total size of the stored bodies, the least recently used pages are evicted beyond this
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Disk-backed HTTP cache for Letterboxd listing pages: bodies are stored with their ETag/Last-Modified
+# so the next run can ask "has this changed?" (If-None-Match/If-Modified-Since) instead of downloading it
+class HttpCache:
+    def __init__(self, path=None, ttl=HTTP_CACHE_TTL, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.path = path or os.path.join(CACHE_DIR, 'http_cache.sqlite')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, body BLOB, final_url TEXT, etag TEXT, last_modified TEXT, "
+            "stored_at REAL, last_used REAL, size INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    # Function to look up a stored page, returns a dict with its body and validators or None
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, final_url, etag, last_modified, stored_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'body': row[0], 'final_url': row[1], 'etag': row[2], 'last_modified': row[3], 'stored_at': row[4]}
+
+    # Function to check whether a stored page can be used without asking the server
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    # Function to build the conditional request headers for a stored page
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # Function to store a downloaded page. Pages without validators are only worth keeping with a TTL
+    def put(self, url, body, headers, final_url=None):
+        self.misses += 1
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified and not self.ttl:
+            return
+        now = time.time()
+        with self.lock:
+            old_size = self.conn.execute("SELECT size FROM pages WHERE url = ?", (url,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, body, final_url, etag, last_modified, stored_at, last_used, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body, final_url or url, etag, last_modified, now, now, len(body))
+            )
+            self.total_bytes += len(body) - (old_size[0] if old_size else 0)
+            self.evict()
+            self.conn.commit()
+
+    # Function to mark a stored page as still valid (after a 304) or just used (after a fresh hit)
+    def touch(self, url, revalidated=False):
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.revalidated += 1
+                self.conn.execute("UPDATE pages SET stored_at = ?, last_used = ? WHERE url = ?", (now, now, url))
+            else:
+                self.hits += 1
+                self.conn.execute("UPDATE pages SET last_used = ? WHERE url = ?", (now, url))
+            self.conn.commit()
+
+    # Function to drop the least recently used pages until the cache fits in max_bytes (lock held)
+    def evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute("SELECT url, size FROM pages ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for url, size in rows:
+                self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    return
+
+    # Function to print the hit/revalidate/miss counts for this run
+    def report(self):
+        print(f"- HTTP cache: {self.hits} fresh hits, {self.revalidated} revalidated (304), {self.misses} downloaded")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
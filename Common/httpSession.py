@@ -0,0 +1,75 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Number of hosts to keep a connection pool for, and connections kept alive per host
+POOL_HOSTS = 10
+POOL_MAXSIZE = 20
+
+# Counters shared by the requests session and the Letterboxd crawl engine
+connection_stats = {'connections': 0, 'requests': 0}
+stats_lock = threading.Lock()
+
+# Function to bump one of the connection counters (called from several threads)
+def count(key):
+    with stats_lock:
+        connection_stats[key] += 1
+
+# Function to print how many requests were made over how many connections
+def report_connections():
+    connections = connection_stats['connections']
+    requests_made = connection_stats['requests']
+    reuse = requests_made / connections if connections else 0
+    print(f"- HTTP: {requests_made} requests over {connections} connections ({reuse:.1f} requests per connection)")
+
+# Only advertise brotli when a decoder is installed, otherwise responses could not be decoded
+def accept_encoding():
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            return 'gzip, deflate, br'
+        except ImportError:
+            pass
+    return 'gzip, deflate'
+
+ACCEPT_ENCODING = accept_encoding()
+
+# Connection pools that count every new connection they open
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        count('connections')
+        return super()._new_conn()
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        count('connections')
+        return super()._new_conn()
+
+# Adapter with a sized keep-alive pool per host
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, **kwargs):
+        super().__init__(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+session = None
+session_lock = threading.Lock()
+
+# Function to get the process-wide requests session (keep-alive, compressed responses)
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = PooledAdapter()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            session.hooks['response'].append(lambda response, *args, **kwargs: count('requests'))
+        return session
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Directory shared by every script for on-disk caches (override with TRAKT_LB_CACHE_DIR)
+CACHE_DIR = os.environ.get('TRAKT_LB_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'TraktandLetterboxd'))
+
+# Films without a TMDb button are re-checked after this many seconds, in case a link gets added later
+NEGATIVE_TTL = 30 * 24 * 60 * 60
+
+# Function to extract the film slug from a Letterboxd film URL (e.g. https://letterboxd.com/film/heat-1995/)
+def film_slug(movie_url):
+    parts = [part for part in movie_url.split('?')[0].split('/') if part]
+    if 'film' in parts and parts.index('film') + 1 < len(parts):
+        return parts[parts.index('film') + 1]
+    return parts[-1]
+
+# Persistent Letterboxd slug -> (TMDB ID, media type) cache shared by all Letterboxd scrapers
+class TmdbCache:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'tmdb_cache.sqlite')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS films ("
+            "slug TEXT PRIMARY KEY, tmdb_id TEXT, media_type TEXT, updated_at REAL)"
+        )
+        # Short links (https://boxd.it/...) from the data export -> the film slug they redirect to
+        self.conn.execute("CREATE TABLE IF NOT EXISTS aliases (uri TEXT PRIMARY KEY, slug TEXT)")
+        self.conn.commit()
+
+    # Function to look up a film, returns (tmdb_id, media_type) or None when it has to be fetched
+    def get(self, movie_url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT tmdb_id, media_type, updated_at FROM films WHERE slug = ?", (film_slug(movie_url),)
+            ).fetchone()
+
+            # Negative entries (no TMDb button) expire so they get another chance later
+            if row is None or (row[0] is None and time.time() - row[2] > NEGATIVE_TTL):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return row[0], row[1]
+
+    # Function to store a resolved film (tmdb_id/media_type may be None for films without a TMDb link)
+    def put(self, movie_url, tmdb_id, media_type):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO films (slug, tmdb_id, media_type, updated_at) VALUES (?, ?, ?, ?)",
+                (film_slug(movie_url), tmdb_id, media_type, time.time())
+            )
+            self.conn.commit()
+
+    # Function to store the TMDB info lbExtract.extract_tmdb_info found on a film page (the crawl engine's
+    # parse callback), returns (movie URL, tmdb_id, media_type)
+    def movie_from_page(self, page):
+        tmdb_id, media_type = page.data
+        self.put(page.url, tmdb_id, media_type)
+        return page.url, tmdb_id, media_type
+
+    # Function to answer a film from the cache without its page, (movie URL, tmdb_id, media_type) or None
+    def cached_movie(self, movie_url):
+        cached = self.get(movie_url)
+        if cached is None:
+            return None
+        return movie_url, cached[0], cached[1]
+
+    # Function to look up the film slug a short link redirects to, None when it hasn't been resolved yet
+    def get_alias(self, uri):
+        with self.lock:
+            row = self.conn.execute("SELECT slug FROM aliases WHERE uri = ?", (uri,)).fetchone()
+            return row[0] if row else None
+
+    # Function to store the film slug a short link redirects to
+    def put_alias(self, uri, slug):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO aliases (uri, slug) VALUES (?, ?)", (uri, slug))
+            self.conn.commit()
+
+    # Function to print the hit/miss counts for this run
+    def report(self):
+        total = self.hits + self.misses
+        print(f"- TMDB cache: {self.hits} hits, {self.misses} misses ({total} lookups)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,87 @@
+import lbExtract
+from crawlEngine import FETCH_ERRORS
+
+# Pages fetched at once while looking for the end of a listing that doesn't link to its last page
+PROBE_WINDOW = 10
+
+# Function to build the URL of page N of a listing, with or without a trailing slash on the base URL
+def page_url(base_url, page_number):
+    return f"{base_url.rstrip('/')}/page/{page_number}/"
+
+# Paginated Letterboxd listing (films, watchlist, ratings, lists). Page 1 is downloaded once: it validates
+# the URL, gives the page count and is primed in the engine, so the crawl that follows reuses it.
+# complete turns False when the page count is only a lower bound (a page failed while counting)
+class Paginator:
+    def __init__(self, engine, base_url, probe_window=PROBE_WINDOW):
+        self.engine = engine
+        self.base_url = base_url
+        self.probe_window = probe_window
+        self.first_page = None
+        self.last_page = None
+        self.complete = True
+
+    # Function to download page 1 (or take it from the engine if it was primed by an earlier paginator)
+    def open(self):
+        if self.first_page is None:
+            self.first_page = self.engine.get(page_url(self.base_url, 1), cached=True)
+            self.engine.prime(self.first_page)
+        return self.first_page
+
+    # Function to find the number of pages: the last page link when there is one, otherwise pages are
+    # probed while they keep linking to a next page, 1 when page 1 has no pagination at all
+    def count_pages(self):
+        if self.last_page is None:
+            page = self.open()
+            self.complete = page.ok
+            self.last_page = lbExtract.extract_last_page(page.body) if page.ok else 1
+            if self.last_page == 1 and page.ok and lbExtract.extract_has_next_page(page.body):
+                self.last_page = self.probe()
+        return self.last_page
+
+    # Function to list the URLs of the given pages, or of the whole listing
+    def page_urls(self, page_numbers=None):
+        if page_numbers is None:
+            page_numbers = range(1, self.count_pages() + 1)
+        return [page_url(self.base_url, page_number) for page_number in page_numbers]
+
+    # Function to tell whether a probed page links to a next one (the page is primed for the crawl).
+    # Pages that failed never get here, the engine hands back None for them instead
+    def probe_page(self, page):
+        self.engine.prime(page)
+        return lbExtract.extract_has_next_page(page.body)
+
+    # Function to find the last page by fetching windows of pages concurrently until one of them
+    # doesn't link any further. A page that fails to load ends the probe: the crawl retries it, but
+    # whether more pages follow it is unknown, so the listing is marked incomplete
+    def probe(self):
+        last_page = 1
+        while True:
+            page_numbers = range(last_page + 1, last_page + self.probe_window + 1)
+            has_next = self.engine.map(self.page_urls(page_numbers), self.probe_page, cached=True)
+            for page_number, page_has_next in zip(page_numbers, has_next):
+                last_page = page_number
+                if page_has_next is None:
+                    self.complete = False
+                    print(f"- Page {page_number} of {self.base_url} failed while counting pages, the pages after it will need a rerun")
+                    return last_page
+                if not page_has_next:
+                    return last_page
+
+# Function to download page 1 of a listing for open_all, None when it couldn't be reached
+async def fetch_first_page(engine, base_url):
+    try:
+        return await engine.fetch(page_url(base_url, 1), cached=True)
+    except FETCH_ERRORS as e:
+        print(f"Error fetching {page_url(base_url, 1)}: {e!r}")
+        return None
+
+# Function to open several listings at once (e.g. one per user), their first pages are downloaded concurrently.
+# A listing that couldn't be reached doesn't stop the others, its paginator tries page 1 again when opened
+def open_all(engine, base_urls):
+    paginators = [Paginator(engine, base_url) for base_url in base_urls]
+    first_pages = engine.run(engine.gather(fetch_first_page(engine, base_url) for base_url in base_urls))
+    for paginator, page in zip(paginators, first_pages):
+        if page is not None:
+            paginator.first_page = page
+            engine.prime(page)
+    return paginators
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import lbExtract
+
+# Benchmark for the HTML parsing stage: parses a folder of saved Letterboxd pages (films/list pages and
+# film pages, e.g. saved from the browser with Ctrl+S) with every installed parser, in the main process
+# and in process pools of growing size, and prints the pages parsed per second for each combination.
+# Usage: python3 parseBenchmark.py [folder with .html files] [rounds]
+# Without a folder the test fixtures are used, 50 rounds over them since they are only a few pages
+
+# Saved pages used when no folder is given, and how many times they are parsed
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'fixtures')
+FIXTURE_ROUNDS = 50
+
+extractors = {}
+
+# Function to parse one page the way the scrapers do (poster entries, TMDb link and page count)
+def parse_page(backend, body):
+    if backend not in extractors:
+        extractors[backend] = lbExtract.select_extractor(backend)
+    extractor = extractors[backend]
+    return len(extractor.poster_entries(body)), extractor.tmdb_link(body), extractor.last_page_link(body)
+
+# Function to load the saved pages into memory, so only parsing is timed
+def load_corpus(folder):
+    bodies = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(folder, name), 'rb') as f:
+                bodies.append(f.read())
+    return bodies
+
+# Function to time one backend with a given number of processes (0 = in the main process)
+def benchmark(backend, bodies, processes):
+    parse = partial(parse_page, backend)
+    if not processes:
+        started = time.perf_counter()
+        for body in bodies:
+            parse(body)
+        return time.perf_counter() - started
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # Warm the workers up (start the processes, import the parser) before timing
+        list(pool.map(parse, bodies[:processes * 2]))
+        started = time.perf_counter()
+        list(pool.map(parse, bodies, chunksize=4))
+        return time.perf_counter() - started
+
+# Main function to run the script
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else FIXTURES_DIR
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else (FIXTURE_ROUNDS if folder == FIXTURES_DIR else 1)
+
+    bodies = load_corpus(folder) * rounds
+    if not bodies:
+        print("No .html files found in that folder.")
+        exit()
+
+    megabytes = sum(len(body) for body in bodies) / 1024 / 1024
+    print(f"- {len(bodies)} pages ({megabytes:.1f} MB), {os.cpu_count()} cores")
+
+    # Pool sizes to try: 1, 2, 4, ... up to the number of cores
+    pool_sizes = [0]
+    while pool_sizes[-1] < os.cpu_count():
+        pool_sizes.append(min(max(1, pool_sizes[-1] * 2), os.cpu_count()))
+
+    for backend in lbExtract.EXTRACTORS:
+        try:
+            lbExtract.select_extractor(backend)
+        except ImportError:
+            print(f"{backend}: not installed")
+            continue
+
+        inline_seconds = None
+        for processes in pool_sizes:
+            seconds = benchmark(backend, bodies, processes)
+            inline_seconds = inline_seconds or seconds
+            label = f"{processes} processes" if processes else "main process"
+            print(f"{backend:>10} | {label:>13} | {len(bodies) / seconds:8.0f} pages/s | {inline_seconds / seconds:4.1f}x")
@@ -0,0 +1,177 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from httpSession import get_session
+from traktRateLimit import bucket_for, report_rate_limits
+
+# Trakt API URL for authorization and syncing
+TRAKT_BASE_URL = 'https://api.trakt.tv'
+
+# Seconds to wait for a response (bulk /sync calls can take a while on large payloads)
+REQUEST_TIMEOUT = 120
+
+# Responses that mean "slow down / try again" (rate limited, Trakt or Cloudflare having trouble),
+# and how often a request is retried before its last response is handed back
+RETRY_STATUSES = {429, 500, 502, 503, 504, 520, 521, 522}
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0
+MAX_RETRY_DELAY = 60
+
+# Items asked for per page when paginating, and pages fetched at once after page 1 (the read bucket still paces them)
+PAGE_LIMIT = 1000
+PAGE_WORKERS = 8
+
+# Errors that are retried like a 5xx (connection dropped, no response in time)
+REQUEST_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+# Calls, seconds spent and retries per endpoint, shared by every client in the process
+endpoint_stats = {}
+stats_lock = threading.Lock()
+
+# Function to work out how long to wait before retrying: Retry-After (in seconds) when Trakt sends it,
+# otherwise exponential backoff with jitter so parallel requests don't all come back at the same moment
+def retry_delay(attempt, retry_after=None):
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), MAX_RETRY_DELAY)
+    delay = RETRY_BACKOFF * 2 ** attempt
+    return min(delay + random.uniform(0, delay / 2), MAX_RETRY_DELAY)
+
+# Function to group requests by endpoint: query string dropped, numeric IDs replaced (/shows/:id/seasons)
+def endpoint_name(method, path):
+    template = re.sub(r'/\d+(?=/|$)', '/:id', path.split('?')[0])
+    return f"{method} {template}"
+
+# Function to print where the Trakt requests went and how long they took, slowest endpoints first
+def report_endpoints():
+    if not endpoint_stats:
+        return
+    print("- Trakt API calls:")
+    for name, stats in sorted(endpoint_stats.items(), key=lambda item: -item[1]['seconds']):
+        average = stats['seconds'] / stats['calls'] if stats['calls'] else 0
+        retries = f", {stats['retries']} retried" if stats['retries'] else ""
+        print(f"  {name}: {stats['calls']} calls, {stats['seconds']:.1f}s total, {average:.2f}s average{retries}")
+    report_rate_limits()
+
+# Raised while paginating when a page can't be retrieved, the failed response is kept for the error message
+class TraktError(Exception):
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} - {response.text}")
+        self.response = response
+
+# Authenticated Trakt API client: every request waits for a token from the read or write bucket
+# (see traktRateLimit), goes through the shared keep-alive session and is retried with backoff
+# on 429, 5xx and connection errors/timeouts
+class TraktClient:
+    def __init__(self, access_token, client_id, max_retries=MAX_RETRIES):
+        self.session = get_session()
+        self.max_retries = max_retries
+        self.headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json',
+            'trakt-api-version': '2',
+            'trakt-api-key': client_id
+        }
+
+    # Function to add a finished call to the endpoint counters
+    def record(self, name, seconds, retried):
+        with stats_lock:
+            stats = endpoint_stats.setdefault(name, {'calls': 0, 'seconds': 0.0, 'retries': 0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['retries'] += retried
+
+    # Function to send a request, path is relative to the API URL (e.g. '/sync/history'). Returns the
+    # response, which is the last one received when every retry was used up. Connection errors that
+    # outlast the retries are raised
+    def request(self, method, path, **kwargs):
+        name = endpoint_name(method, path)
+        bucket = bucket_for(method)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, TRAKT_BASE_URL + path, headers=self.headers,
+                                                timeout=REQUEST_TIMEOUT, **kwargs)
+                error = None
+            except REQUEST_ERRORS as e:
+                response = None
+                error = e
+            self.record(name, time.perf_counter() - started, attempt > 0)
+            if response is not None and 'X-Ratelimit' in response.headers:
+                bucket.update(response.headers['X-Ratelimit'])
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt == self.max_retries:
+                break
+
+            if response is not None:
+                reason = "Rate limit exceeded (429)" if response.status_code == 429 else f"Trakt error ({response.status_code})"
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+            else:
+                reason = f"Request failed ({error.__class__.__name__})"
+                delay = retry_delay(attempt)
+            print(f"{reason} on {name}. Waiting {delay:.0f} seconds before retrying... (Attempt {attempt + 1}/{self.max_retries})")
+
+            # A 429 holds back every request on the same budget, not just this one
+            if response is not None and response.status_code == 429:
+                bucket.block(delay)
+            else:
+                time.sleep(delay)
+
+        if response is None:
+            raise error
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, payload=None, **kwargs):
+        return self.request('POST', path, json=payload, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    # Function to get the items of one page, raising TraktError when it can't be retrieved
+    def get_page(self, path, page, limit):
+        separator = '&' if '?' in path else '?'
+        response = self.get(f"{path}{separator}page={page}&limit={limit}")
+        if response.status_code != 200:
+            raise TraktError(response)
+        return response, response.json()
+
+    # Function to yield every item of a paginated endpoint, in order. Page 1 gives the page and item
+    # counts (X-Pagination-Page-Count/Item-Count), then the other pages are fetched concurrently, so no
+    # request is spent on an empty page past the end. Endpoints without pagination headers are one page
+    def paginate(self, path, description, limit=PAGE_LIMIT, workers=PAGE_WORKERS):
+        first_page, items = self.get_page(path, 1, limit)
+        page_count = int(first_page.headers.get('X-Pagination-Page-Count', 1))
+        item_count = first_page.headers.get('X-Pagination-Item-Count', len(items))
+        print(f"Retrieving {item_count} {description} ({page_count} pages)...")
+        yield from items
+
+        if page_count > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, page_count - 1)) as executor:
+                pages = [executor.submit(self.get_page, path, page, limit) for page in range(2, page_count + 1)]
+                try:
+                    for page, future in enumerate(pages, 2):
+                        yield from future.result()[1]
+                        print(f"Retrieved page {page} of {page_count} of {description}...")
+                finally:
+                    # Don't fetch the rest when the caller stops early or a page failed
+                    for future in pages:
+                        future.cancel()
+
+clients = {}
+clients_lock = threading.Lock()
+
+# Function to get the client for an access token (one per token and client ID, shared by the script's functions)
+def get_client(access_token, client_id):
+    with clients_lock:
+        key = (access_token, client_id)
+        if key not in clients:
+            clients[key] = TraktClient(access_token, client_id)
+        return clients[key]
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from lbCache import CACHE_DIR
+
+# fcntl only exists on Linux/macOS, elsewhere the buckets are shared by the threads of one script only
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Trakt's documented limits for authenticated calls: 1000 GETs per 5 minutes, and 1 POST/PUT/DELETE per second
+READ_LIMIT = 1000
+READ_PERIOD = 300
+WRITE_LIMIT = 1
+WRITE_PERIOD = 1
+
+# Share the buckets with other scripts running at the same time (a state file per bucket, locked with
+# fcntl), so two scripts on the same account don't each spend the full budget. Set TRAKT_SHARED_RATE_LIMIT=1
+SHARED_STATE = os.environ.get('TRAKT_SHARED_RATE_LIMIT', '') not in ('', '0')
+STATE_DIR = os.path.join(CACHE_DIR, 'trakt_rate_limit')
+
+# Function to turn Trakt's "until" timestamp (e.g. 2024-10-10T00:24:00Z) into seconds since the epoch
+def parse_until(until):
+    try:
+        return datetime.fromisoformat(until.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+# Token bucket for one of Trakt's budgets: holds up to `limit` tokens, refilled at limit/period per second,
+# and every request takes one. Time is wall-clock time so the state means the same in every process
+class TokenBucket:
+    def __init__(self, name, limit, period, shared=SHARED_STATE, state_dir=STATE_DIR):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.state_path = os.path.join(state_dir, f"{name}.json") if shared and fcntl else None
+        self.waits = 0
+        self.waited = 0.0
+
+    # Function to hold the bucket for one change: the thread lock, plus the locked state file when the
+    # bucket is shared (the state other scripts left is loaded first and the new state saved after)
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if self.state_path is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(self.state_path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.load(f)
+                        self.tokens = state['tokens']
+                        self.updated = state['updated']
+                        self.blocked_until = state['blocked_until']
+                    except (ValueError, KeyError):
+                        pass
+                    yield
+                    f.seek(0)
+                    f.truncate()
+                    json.dump({'tokens': self.tokens, 'updated': self.updated, 'blocked_until': self.blocked_until}, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Function to add the tokens earned since the last change
+    def refill(self, now):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / self.period)
+        self.updated = now
+
+    # Function to take a token if there is one. Returns 0 when it was taken, otherwise the seconds to wait
+    def try_take(self):
+        now = time.time()
+        self.refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) * self.period / self.limit
+
+    # Function to wait until a request may be sent (called from several threads)
+    def acquire(self):
+        while True:
+            with self.locked():
+                delay = self.try_take()
+            if delay <= 0:
+                return
+            self.waits += 1
+            self.waited += delay
+            time.sleep(delay)
+
+    # Function to stop every request on this bucket for a while (a 429 with Retry-After, or a used-up window)
+    def block(self, seconds):
+        with self.locked():
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+            self.tokens = 0.0
+
+    # Function to correct the bucket from Trakt's X-Ratelimit header, a JSON object like
+    # {"name": "AUTHED_API_GET_LIMIT", "period": 300, "limit": 1000, "remaining": 998, "until": "..."}.
+    # Trakt counts in fixed windows, so when nothing is left the bucket waits for the window to end
+    def update(self, header):
+        try:
+            state = json.loads(header)
+            limit, period, remaining = int(state['limit']), int(state['period']), int(state['remaining'])
+        except (TypeError, ValueError, KeyError):
+            return
+        with self.locked():
+            if limit > 0 and period > 0:
+                self.limit, self.period = limit, period
+            self.refill(time.time())
+            self.tokens = min(self.tokens, remaining)
+            until = parse_until(state.get('until'))
+            if remaining <= 0 and until:
+                self.blocked_until = max(self.blocked_until, until)
+
+# The process-wide buckets: GETs spend the read budget, everything else the write budget
+read_bucket = TokenBucket('read', READ_LIMIT, READ_PERIOD)
+write_bucket = TokenBucket('write', WRITE_LIMIT, WRITE_PERIOD)
+
+# Function to get the bucket a request spends
+def bucket_for(method):
+    return read_bucket if method == 'GET' else write_bucket
+
+# Function to print how long requests were held back to stay inside the limits
+def report_rate_limits():
+    for bucket in (read_bucket, write_bucket):
+        if bucket.waits:
+            print(f"- Trakt {bucket.name} limit: waited {bucket.waited:.1f}s over {bucket.waits} pauses")
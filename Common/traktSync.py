@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from traktClient import REQUEST_ERRORS
+
+# Items per /sync request. Trakt answers a few hundred items quickly, it's the single huge bodies
+# (a whole history restore) that end in 504s
+CHUNK_SIZE = 500
+
+# Chunks in flight at once, the write bucket still starts them one per second
+PIPELINE_DEPTH = 4
+
+# Times the chunks that failed are sent again (on top of the client's own retries per request)
+CHUNK_ROUNDS = 3
+
+# Function to split a /sync payload ({"movies": [...], "episodes": [...]}) into payloads of at most
+# chunk_size items, keeping the item order
+def chunk_payload(payload, chunk_size=CHUNK_SIZE):
+    chunk, count = {}, 0
+    for section, items in payload.items():
+        for item in items:
+            chunk.setdefault(section, []).append(item)
+            count += 1
+            if count == chunk_size:
+                yield chunk
+                chunk, count = {}, 0
+    if chunk:
+        yield chunk
+
+# Function to count the items in a payload
+def count_items(payload):
+    return sum(len(items) for items in payload.values())
+
+# Combined outcome of every chunk: the counts Trakt reports (added/updated/existing/deleted per item type),
+# the items it couldn't match (not_found), and the chunks that still failed after every round
+class SyncResult:
+    def __init__(self):
+        self.counts = {}
+        self.not_found = {}
+        self.failed = []
+        self.lock = threading.Lock()
+
+    # Function to add one response body, e.g. {"added": {"movies": 2}, "not_found": {"movies": [...]}}
+    def add_response(self, body):
+        with self.lock:
+            for key, value in body.items():
+                if not isinstance(value, dict):
+                    continue
+                if key == 'not_found':
+                    for section, items in value.items():
+                        if items:
+                            self.not_found.setdefault(section, []).extend(items)
+                else:
+                    counts = self.counts.setdefault(key, {})
+                    for section, number in value.items():
+                        if isinstance(number, int):
+                            counts[section] = counts.get(section, 0) + number
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    # Function to print the totals, what Trakt didn't find and what couldn't be sent
+    def report(self, description):
+        for key, counts in self.counts.items():
+            summary = ", ".join(f"{number} {section}" for section, number in counts.items() if number)
+            print(f"- {description}: {key} {summary or 'nothing'}")
+        if self.not_found:
+            print(f"- {description}: {count_items(self.not_found)} items not found on Trakt")
+        if self.failed:
+            items = sum(count_items(chunk) for chunk, error in self.failed)
+            print(f"- {description}: {len(self.failed)} requests ({items} items) failed, last error: {self.failed[-1][1]}")
+
+# Function to send one chunk, returns None when Trakt accepted it, otherwise the error to report
+def send_chunk(client, path, chunk, result):
+    try:
+        response = client.post(path, chunk)
+    except REQUEST_ERRORS as e:
+        return f"{e.__class__.__name__}: {e}"
+    if response.status_code not in (200, 201):
+        return f"{response.status_code} - {response.text}"
+    result.add_response(response.json())
+    return None
+
+# Function to send a large /sync payload (history, ratings, watchlist...) as size-bounded chunks, several
+# in flight at once. Chunks that fail are sent again one at a time for a few rounds, so a body that timed
+# out doesn't compete with the others for Trakt's attention. Returns the SyncResult
+def sync_items(client, path, payload, chunk_size=CHUNK_SIZE, depth=PIPELINE_DEPTH, rounds=CHUNK_ROUNDS):
+    result = SyncResult()
+    chunks = list(chunk_payload(payload, chunk_size))
+    if len(chunks) > 1:
+        print(f"Sending {count_items(payload)} items in {len(chunks)} requests of up to {chunk_size}...")
+
+    # The first round sends every chunk, each of the rounds after it resends the ones that failed
+    for round_number in range(rounds + 1):
+        if not chunks:
+            break
+        workers = depth
+        if round_number:
+            print(f"Sending {len(chunks)} failed requests again, one at a time...")
+            workers = 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            errors = list(executor.map(lambda chunk: send_chunk(client, path, chunk, result), chunks))
+        result.failed = [(chunk, error) for chunk, error in zip(chunks, errors) if error]
+        chunks = [chunk for chunk, error in result.failed]
+
+    return result
@@ -0,0 +1,144 @@
+import os
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from lbCache import TmdbCache, film_slug
+import lbExtract
+from crawlEngine import CrawlEngine
+from httpSession import report_connections
+
+# Same output files and columns as lbHistory, so traktHistory can import either one
+csv_file = "watched_movies_tmdb.csv"
+watchlist_csv_file = "watchlist_tmdb.csv"
+csv_header = ["Letterboxd URL", "TMDB ID", "Type"]
+
+# Maximum number of Letterboxd requests in flight at once (only films missing from the cache are fetched)
+max_concurrency = 100
+
+# Worker processes for HTML parsing (0 = parse in the main process), see Common/parseBenchmark.py
+parse_processes = lbExtract.default_parse_processes()
+
+# Persistent Letterboxd film -> TMDB ID cache shared with the other Letterboxd scrapers
+tmdb_cache = TmdbCache()
+
+# Shared asyncio crawl engine used for every Letterboxd request
+engine = CrawlEngine(concurrency=max_concurrency, parse_processes=parse_processes)
+
+# Function to read one CSV straight out of the export ZIP (nothing is extracted to disk),
+# None when the export doesn't contain it. Lists and deleted items have their own folders
+def read_export_csv(archive, name):
+    members = [
+        member for member in archive.namelist()
+        if os.path.basename(member) == name and 'lists/' not in member and 'deleted/' not in member
+    ]
+    if not members:
+        return None
+    with archive.open(min(members, key=len)) as f:
+        return pd.read_csv(f)
+
+# Function to turn a fetched short link into (uri, (movie URL, tmdb_id, media_type)), the
+# request follows the boxd.it redirect so the page is the film page itself
+def extract_tmdb_info(page):
+    movie_url = page.final_url
+    tmdb_id, media_type = page.data
+    tmdb_cache.put_alias(page.url, film_slug(movie_url))
+    tmdb_cache.put(movie_url, tmdb_id, media_type)
+    return page.url, (movie_url, tmdb_id, media_type)
+
+# Function to resolve export URIs to (movie URL, tmdb_id, media_type): cache first, then the film pages
+def resolve_uris(uris):
+    resolved = {}
+    uris_to_fetch = []
+    for uri in uris:
+        slug = tmdb_cache.get_alias(uri)
+        movie_url = f"{lbExtract.LETTERBOXD_URL}/film/{slug}/" if slug else None
+        cached = tmdb_cache.get(movie_url) if movie_url else None
+        if cached is not None:
+            resolved[uri] = (movie_url, cached[0], cached[1])
+        else:
+            uris_to_fetch.append(uri)
+
+    if uris_to_fetch:
+        print(f"- Looking up {len(uris_to_fetch)} films that aren't cached yet")
+        resolved.update(result for result in engine.map(uris_to_fetch, extract_tmdb_info, extract=lbExtract.extract_tmdb_info) if result)
+    return resolved
+
+# Function to add the Letterboxd URL, TMDB ID and Type columns for every URI in the frame.
+# Films that couldn't be loaded keep their short link and an empty TMDB ID, like lbHistory does
+def add_tmdb_columns(films):
+    uris = films['Letterboxd URI']
+    resolved = resolve_uris(uris.unique())
+    rows = [resolved.get(uri, (uri, None, None)) for uri in uris]
+    films[csv_header] = pd.DataFrame(rows, columns=csv_header, index=films.index)
+    return films
+
+# Function to build watched_movies_tmdb.csv from watched.csv (and ratings.csv)
+def export_watched(archive, include_ratings=False, csv_file=csv_file):
+    watched = read_export_csv(archive, 'watched.csv')
+    if watched is None:
+        print("watched.csv is missing from the export. Please check the ZIP file.")
+        exit()
+    films = watched[['Letterboxd URI']]
+
+    header = csv_header
+    ratings = read_export_csv(archive, 'ratings.csv') if include_ratings else None
+    if ratings is not None:
+        # Rating a film also marks it as watched, so keep rated films even if watched.csv lags behind
+        films = films.merge(ratings[['Letterboxd URI', 'Rating']], on='Letterboxd URI', how='outer')
+        # Letterboxd stars (0.5-5) to a whole Trakt rating (1-10), same rounding as lbHistory
+        films['Rating'] = np.ceil(films['Rating'] * 2).astype('Int64')
+        header = csv_header + ["Rating"]
+
+    films = add_tmdb_columns(films.drop_duplicates('Letterboxd URI').copy())
+    films[header].to_csv(csv_file, index=False)
+
+    # Feedback after saving
+    print(f"- {len(films)} movies/shows saved to {csv_file}")
+
+# Function to build watchlist_tmdb.csv from watchlist.csv
+def export_watchlist(archive, csv_file=watchlist_csv_file):
+    watchlist = read_export_csv(archive, 'watchlist.csv')
+    if watchlist is None:
+        print("watchlist.csv is missing from the export, skipping the watchlist.")
+        return
+
+    films = add_tmdb_columns(watchlist[['Letterboxd URI']].drop_duplicates().copy())
+    films[csv_header].to_csv(csv_file, index=False)
+
+    # Feedback after saving
+    print(f"- {len(films)} watchlist movies/shows saved to {csv_file}")
+
+# Function to ask for the export ZIP until a readable one is given
+def get_export_zip():
+    while True:
+        zip_path = input("Enter the path to your Letterboxd export ZIP: ").strip().strip('"')
+        if zipfile.is_zipfile(zip_path):
+            return zip_path
+        print("That file doesn't exist or isn't a ZIP file. Please try again.")
+
+# Main function to run the script
+if __name__ == "__main__":
+    # The export is downloaded from Letterboxd under Settings > Data > Export your data
+    zip_path = get_export_zip()
+
+    # Ask if the user wants to import ratings
+    include_ratings = input("Do you want to include ratings? (yes/no): ").strip().lower() == "yes"
+
+    # Ask if the user wants to convert their watchlist
+    include_watchlist = input("Do you want to convert your watchlist? (yes/no): ").strip().lower() == "yes"
+
+    with zipfile.ZipFile(zip_path) as archive:
+        print("- Reading the export")
+        export_watched(archive, include_ratings)
+        if include_watchlist:
+            export_watchlist(archive)
+
+    engine.close()
+    engine.report()
+    tmdb_cache.report()
+    report_connections()
+    print("Script finished.")
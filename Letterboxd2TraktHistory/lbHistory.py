@@ -1,156 +1,266 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
+import json
 import math
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import sys
+from datetime import datetime, timezone
+
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from lbCache import TmdbCache, film_slug
+import lbExtract
+from crawlEngine import CrawlEngine, FETCH_ERRORS
+from crawlJournal import CrawlJournal, journal_path
+from httpCache import HttpCache
+from lbPaginator import Paginator, page_url
+from httpSession import report_connections
 
 # Define the header for the output CSV files
 csv_file = "watched_movies_tmdb.csv"
 watchlist_csv_file = "watchlist_tmdb.csv"
 csv_header = ["Letterboxd URL", "TMDB ID", "Type"]
 
-# Function to extract movie URLs and (optional) ratings from the ratings page
-def extract_ratings(page_url):
-    response = requests.get(page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
+# Checkpoint of what was exported for each user, used by the incremental and RSS modes
+checkpoint_file = "lb_checkpoint_{username}.json"
+
+# Member RSS feed with the most recent diary entries (including TMDB IDs, watch dates and ratings)
+rss_url = "https://letterboxd.com/{username}/rss/"
+
+# Maximum number of Letterboxd requests in flight at once
+max_concurrency = 100
+
+# Worker processes for HTML parsing (0 = parse in the main process), see Common/parseBenchmark.py
+parse_processes = lbExtract.default_parse_processes()
+
+# Persistent Letterboxd film -> TMDB ID cache shared with the other Letterboxd scrapers
+tmdb_cache = TmdbCache()
+
+# Shared asyncio crawl engine used for every Letterboxd request (listing pages are revalidated
+# against the on-disk HTTP cache instead of being downloaded again)
+engine = CrawlEngine(concurrency=max_concurrency, http_cache=HttpCache(), parse_processes=parse_processes)
+
+# Function to build a CSV row, adding the Trakt rating when the movie was rated
+def movie_row(movie, rating=None):
+    row = list(movie)
+    if rating is not None:
+        # Ensure the rating is a whole number for Trakt (rounded after doubling)
+        trakt_rating = math.ceil(rating * 2)
+        row.append(trakt_rating)  # Add the Trakt-compliant rating
+    return row
+
+# Function to crawl the listing pages and the film pages as one streaming pipeline. Every listing page
+# and resolved movie is appended to a journal as soon as it is done, so an interrupted crawl can be
+# resumed, and the CSV is written from the journal at the end. seen_films collects {slug: rating}
+# for every film written to the CSV (used for the incremental checkpoint). Returns whether every
+# page and film was crawled
+def crawl_to_csv(base_url, scrape_ratings=False, csv_file=csv_file, seen_films=None):
+    journal = CrawlJournal(journal_path(csv_file), {'url': base_url, 'ratings': scrape_ratings})
+    resume = journal.can_resume() and input(f"A previous crawl of {base_url} didn't finish. Resume it? (yes/no): ").strip().lower() == "yes"
+    journal.open(resume)
+
+    paginator = Paginator(engine, base_url)
+    last_page = paginator.count_pages()
+    page_numbers = [page for page in range(1, last_page + 1) if page not in journal.pages]
+    page_urls = paginator.page_urls(page_numbers)
+    header = csv_header + ["Rating"] if scrape_ratings else csv_header
+
+    # The rating span is part of the same poster markup as the movie link, so the films pages
+    # give us URLs and ratings in a single pass (no second crawl of /films/by/entry-rating/)
     ratings_data = {}
-    
-    # Get all rated movie containers (list items)
-    movie_items = soup.find_all('li', class_='poster-container')
-    
-    for li in movie_items:
-        lazy_load_div = li.find('div', class_='really-lazy-load')
-        if lazy_load_div and lazy_load_div.get('data-target-link'):
-            movie_url = "https://letterboxd.com" + lazy_load_div['data-target-link']
-            rating_tag = li.find('span', class_='rating')
-            if rating_tag:
-                # Find the class that contains 'rated-' and extract the rating value
-                rating_class = next((cls for cls in rating_tag['class'] if 'rated-' in cls), None)
-                if rating_class:
-                    # Convert rating by stripping 'rated-' and dividing by 2 to map to the 10-point scale
-                    letterboxd_rating = float(rating_class.replace('rated-', '')) / 2
-                    ratings_data[movie_url] = letterboxd_rating
-    
-    return ratings_data
 
+    # Pages finished before the interruption aren't fetched again, only their unresolved films are
+    pending = []
+    for page_number, entries in journal.pages.items():
+        for index, (movie_url, rating) in enumerate(entries):
+            ratings_data[movie_url] = rating
+            if movie_url not in journal.resolved:
+                pending.append(((page_number, index), movie_url))
+    if resume:
+        print(f"- Resuming: {len(journal.pages)} pages and {len(journal.resolved)} movies already done")
 
-# Function to extract movie URLs from the main list page
-def extract_movie_urls(page_url):
-    response = requests.get(page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
+    def extract_movies_and_ratings(page):
+        movie_entries = page.data
+        journal.add_page(lbExtract.parse_page_link(page.url), movie_entries)
+        for movie_url, rating in movie_entries:
+            ratings_data[movie_url] = rating
+        return [movie_url for movie_url, rating in movie_entries]
+
+    def journal_movie(position, movie):
+        movie_url, tmdb_id, media_type = movie
+        journal.add_film(movie_url, tmdb_id=tmdb_id, media_type=media_type, rating=ratings_data.pop(movie_url, None))
+
+    # Progress feedback
+    print("- Extracting movies and gathering TMDB Ids")
+
+    try:
+        failed = engine.pipeline(page_urls, extract_movies_and_ratings, tmdb_cache.movie_from_page, journal_movie,
+                                 lookup=tmdb_cache.cached_movie, page_numbers=page_numbers, pending=pending,
+                                 extract_listing=lbExtract.extract_poster_entries, extract_detail=lbExtract.extract_tmdb_info)
+    except BaseException:
+        journal.close(finished=False)
+        print("- Crawl interrupted, run the script again to resume it")
+        raise
+
+    with open(csv_file, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for film in journal.films():
+            movie = (film['url'], film['tmdb_id'], film['media_type'])
+            writer.writerow(movie_row(movie, film['rating'] if scrape_ratings else None))
+            if seen_films is not None:
+                seen_films[film_slug(film['url'])] = film['rating']
+
+    # Keep the journal when pages failed (or the page count is incomplete), so a rerun can resume and fetch just those
+    finished = not failed and paginator.complete
+    journal.close(finished)
+    if not finished:
+        print("- Some pages failed, run the script again and resume to retry just those")
+
+    # Feedback after saving
+    print(f"- Movies/shows saved to {csv_file}")
+    return finished
+
+# Function to resolve TMDB IDs for a handful of movie URLs (cache first, then the film pages)
+def resolve_movies(movie_urls):
     movie_data = []
-    
-    # Get all movie containers (list items)
-    movie_items = soup.find_all('li', class_='poster-container')
-    
-    for li in movie_items:
-        lazy_load_div = li.find('div', class_='really-lazy-load')
-        
-        if lazy_load_div and lazy_load_div.get('data-target-link'):
-            movie_url = "https://letterboxd.com" + lazy_load_div['data-target-link']
-            movie_data.append(movie_url)
-    
+    urls_to_fetch = []
+    for movie_url in movie_urls:
+        movie = tmdb_cache.cached_movie(movie_url)
+        if movie is not None:
+            movie_data.append(movie)
+        else:
+            urls_to_fetch.append(movie_url)
+    movie_data.extend(movie for movie in engine.map(urls_to_fetch, tmdb_cache.movie_from_page, extract=lbExtract.extract_tmdb_info) if movie)
     return movie_data
 
-# Function to extract TMDb info from the detailed movie page
-def extract_tmdb_info(movie_url):
-    response = requests.get(movie_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    # Find the TMDb button by class and text content
-    tmdb_button = soup.find('a', class_='micro-button track-event', string='TMDb')
-    
-    if tmdb_button:
-        tmdb_link = tmdb_button.get('href')
-        
-        # Extract TMDB ID and type (movie or tv)
-        if "/movie/" in tmdb_link:
-            tmdb_id = tmdb_link.split("/movie/")[1].strip("/")
-            media_type = "movie"
-        elif "/tv/" in tmdb_link:
-            tmdb_id = tmdb_link.split("/tv/")[1].strip("/")
-            media_type = "show"
-        else:
-            tmdb_id = None
-            media_type = None
-        
-        return movie_url, tmdb_id, media_type
-    else:
-        return movie_url, None, None
-
-# Function to find the last page number by parsing pagination
-def get_last_page(base_url):
-    first_page_url = base_url + "/page/1/"
-    response = requests.get(first_page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Find pagination container
-    pagination = soup.find('div', class_='paginate-pages')
-    
-    if pagination:
-        # Find the last page number by looking for the last link in the pagination
-        last_page_link = pagination.find_all('a')[-1].get('href')
-        last_page_number = int(last_page_link.split('/page/')[-1].strip('/'))
-    else:
-        # If no pagination is found, we assume there's only one page
-        last_page_number = 1
-
-    return last_page_number
-
-# Function to crawl multiple pages using ThreadPoolExecutor
-def crawl_movies(last_page, base_url):
-    all_movie_urls = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = []
-        for page in range(1, last_page + 1):
-            page_url = base_url + f"/page/{page}/"
-            futures.append(executor.submit(extract_movie_urls, page_url))
-        
-        # Progress feedback
-        print("- Extracting movies from pages")
-        
-        # Collect the results as they are completed
-        for future in as_completed(futures):
-            all_movie_urls.extend(future.result())
-    
-    return all_movie_urls
-
-# Function to crawl detailed movie pages for TMDb links
-def crawl_detailed_movie_pages(movie_urls):
-    all_movie_data = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = []
-        for movie_url in movie_urls:
-            futures.append(executor.submit(extract_tmdb_info, movie_url))
-        
-        # Progress feedback
-        print("- Gathering TMDB Ids")
-        
-        # Collect the results as they are completed
-        for future in as_completed(futures):
-            all_movie_data.append(future.result())
-    
-    return all_movie_data
+# Function to crawl only what changed since the checkpoint. The films pages list the most recently
+# added films first, so the crawl walks them in order and stops at the first page where every film
+# was already exported (with the same rating). Only the new/changed films are written to the CSV.
+# Returns the updated films, or None when a films page couldn't be loaded (the caller then does a full crawl)
+def crawl_incremental(base_url, checkpoint, scrape_ratings=False, csv_file=csv_file):
+    known_films = checkpoint['films']
+    changed_entries = []
+    page_number = 1
+    last_page = 1
+
+    print("- Looking for films added since the last run")
+    while page_number <= last_page:
+        try:
+            page = engine.get(page_url(base_url, page_number), cached=True)
+        except FETCH_ERRORS as e:
+            print(f"- Couldn't load page {page_number} ({e!r}), falling back to crawling all the films pages")
+            return None
+        if not page.ok:
+            # An error page has no films in it and would look like "nothing changed"
+            print(f"- Couldn't load page {page_number} ({page.status}), falling back to crawling all the films pages")
+            return None
+        if page_number == 1:
+            last_page = lbExtract.extract_last_page(page.body)
+
+        # Listings that only link to the next page are walked one more page at a time
+        if page_number == last_page and lbExtract.extract_has_next_page(page.body):
+            last_page += 1
 
-# Function to save the extracted data to a CSV file
-def save_to_csv(movie_data, ratings_data=None, csv_file=csv_file):
-    if ratings_data:
-        csv_header.append("Rating")
+        page_changes = []
+        for movie_url, rating in lbExtract.extract_poster_entries(page.body):
+            slug = film_slug(movie_url)
+            if slug not in known_films or (scrape_ratings and known_films[slug] != rating):
+                page_changes.append((movie_url, rating))
+        changed_entries.extend(page_changes)
+
+        # A page made up entirely of known, unchanged films means everything older is exported too
+        if not page_changes:
+            break
+        page_number += 1
+
+    print(f"- {len(changed_entries)} new or changed films found in {min(page_number, last_page)} page(s)")
+
+    ratings_data = dict(changed_entries)
+    movies = resolve_movies([movie_url for movie_url, rating in changed_entries])
+    header = csv_header + ["Rating"] if scrape_ratings else csv_header
     with open(csv_file, mode='w', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow(csv_header)
-        for movie in movie_data:
-            row = list(movie)
-            if ratings_data and movie[0] in ratings_data:
-                # Ensure the rating is a whole number for Trakt (rounded after doubling)
-                trakt_rating = math.ceil(ratings_data[movie[0]] * 2)
-                row.append(trakt_rating)  # Add the Trakt-compliant rating
-            writer.writerow(row)
-    
+        writer.writerow(header)
+        for movie in movies:
+            writer.writerow(movie_row(movie, ratings_data[movie[0]] if scrape_ratings else None))
+
     # Feedback after saving
-    print(f"- Movies/shows saved to {csv_file}")
+    print(f"- New/changed movies/shows saved to {csv_file}")
+
+    # Films whose page failed aren't in the CSV, leaving them out of the checkpoint makes the next run pick them up
+    if len(movies) < len(changed_entries):
+        print(f"- {len(changed_entries) - len(movies)} films couldn't be loaded, the next run will try them again")
+
+    films = dict(known_films)
+    films.update({film_slug(movie_url): ratings_data.get(movie_url) for movie_url, tmdb_id, media_type in movies})
+    return films
+
+# Function to sync recent diary entries from the RSS feed, one request and no film pages at all.
+# Returns the updated films, or None when the feed doesn't reach back to the last run, in which
+# case there may be entries beyond the feed window and the caller falls back to crawling the HTML
+def crawl_rss(username, checkpoint, scrape_ratings=False, csv_file=csv_file):
+    print("- Reading recent diary entries from the RSS feed")
+    try:
+        page = engine.get(rss_url.format(username=username), cached=True)
+    except FETCH_ERRORS as e:
+        print(f"- Couldn't load the RSS feed ({e!r}), falling back to crawling the films pages")
+        return None
+    if not page.ok:
+        print(f"- Couldn't load the RSS feed ({page.status}), falling back to crawling the films pages")
+        return None
+
+    entries = lbExtract.extract_rss_entries(page.body)
+    last_crawl = datetime.strptime(checkpoint['last_crawl'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    if not entries or min(published for *_, published in entries) > last_crawl:
+        print("- The RSS feed doesn't go back to the last run, falling back to crawling the films pages")
+        return None
+
+    known_films = checkpoint['films']
+    changed_movies = {}
+    for movie_url, tmdb_id, media_type, rating, published in entries:
+        # The feed already tells us the TMDB ID, keep it for the other scrapers too
+        tmdb_cache.put(movie_url, tmdb_id, media_type)
+
+        # Entries are newest first, so the first entry for a film has its current rating
+        slug = film_slug(movie_url)
+        if slug in changed_movies:
+            continue
+        if slug not in known_films or (scrape_ratings and rating is not None and known_films[slug] != rating):
+            changed_movies[slug] = (movie_url, tmdb_id, media_type, rating)
+
+    print(f"- {len(changed_movies)} new or changed films found in the RSS feed")
+
+    header = csv_header + ["Rating"] if scrape_ratings else csv_header
+    with open(csv_file, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for movie_url, tmdb_id, media_type, rating in changed_movies.values():
+            writer.writerow(movie_row((movie_url, tmdb_id, media_type), rating if scrape_ratings else None))
+
+    # Feedback after saving
+    print(f"- New/changed movies/shows saved to {csv_file}")
+
+    films = dict(known_films)
+    for slug, (movie_url, tmdb_id, media_type, rating) in changed_movies.items():
+        films[slug] = rating if rating is not None else known_films.get(slug)
+    return films
+
+# Function to load the incremental checkpoint for a user, None if there isn't one yet
+def load_checkpoint(username):
+    file_path = checkpoint_file.format(username=username)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+# Function to save what has been exported for a user, along with the time of this crawl
+def save_checkpoint(username, films):
+    with open(checkpoint_file.format(username=username), 'w') as f:
+        json.dump({
+            'username': username,
+            'last_crawl': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'films': films
+        }, f)
 
 # Function to get the Letterboxd username and validate the input URL
 def get_letterboxd_url():
@@ -158,23 +268,16 @@ def get_letterboxd_url():
         username = input("Enter your Letterboxd username: ").strip()
         base_url = f"https://letterboxd.com/{username}/films"
         
-        # Validate the URL by trying to access the first page
+        # Validate the URL with the first page, which the crawl reuses instead of downloading it again
         try:
-            response = requests.get(base_url)
-            if response.status_code == 200:
+            page = Paginator(engine, base_url).open()
+            if page.ok:
                 return base_url, username
             else:
                 print(f"Invalid username or the page doesn't exist. Please try again.")
-        except requests.RequestException:
+        except FETCH_ERRORS:
             print("Error accessing the page. Please check your internet connection and try again.")
 
-# Function to crawl the watchlist
-def crawl_watchlist(username):
-    watchlist_url = f"https://letterboxd.com/{username}/watchlist/"
-    last_page = get_last_page(watchlist_url)
-    watchlist_movies = crawl_movies(last_page, watchlist_url)  # Reusing the function to scrape watchlist
-    return watchlist_movies
-
 # Main function to run the script
 if __name__ == "__main__":
     # Get the user's Letterboxd URL and username
@@ -186,33 +289,40 @@ if __name__ == "__main__":
     # Ask if the user wants to scrape their watchlist
     scrape_watchlist = input("Do you want to scrape your watchlist? (yes/no): ").strip().lower() == "yes"
 
-    # Find the last page number for watched movies
-    last_page = get_last_page(base_url)
-    
-    # Crawl all pages to collect movie URLs
-    movie_urls = crawl_movies(last_page, base_url)
-    
-    # Crawl detailed movie pages to extract TMDb links
-    movie_data = crawl_detailed_movie_pages(movie_urls)
-
-    ratings_data = None
-    if scrape_ratings:
-        # If ratings scraping is selected, scrape from the ratings page
-        ratings_url = f"https://letterboxd.com/{username}/films/by/entry-rating/"
-        ratings_data = {}
-        last_ratings_page = get_last_page(ratings_url)
-        for page in range(1, last_ratings_page + 1):
-            page_url = ratings_url + f"page/{page}/"
-            ratings_data.update(extract_ratings(page_url))
+    # Offer the quicker export modes when this user has been exported before
+    checkpoint = load_checkpoint(username)
+    export_mode = 'full'
+    if checkpoint:
+        print(f"This account was last exported on {checkpoint['last_crawl']}. How do you want to export?")
+        print("'full' (everything), 'incremental' (films added or re-rated since then) or 'rss' (recent diary entries from the RSS feed)")
+        export_mode = input("Type 'full', 'incremental' or 'rss': ").strip().lower()
+
+    films = None
+    if export_mode == 'rss':
+        # One feed request, falls back to the incremental crawl when the feed window is exceeded or can't be loaded
+        films = crawl_rss(username, checkpoint, scrape_ratings)
+    if export_mode in ('rss', 'incremental') and films is None:
+        # Crawl only the newest pages and save the new/changed movies to CSV (None means a full crawl is needed)
+        films = crawl_incremental(base_url, checkpoint, scrape_ratings)
+    if films is None:
+        # Crawl the watched movies (and their ratings), saving them to CSV while the crawl runs
+        films = {}
+        if not crawl_to_csv(base_url, scrape_ratings, seen_films=films):
+            # The newer pages being known would make the next incremental run stop before the failed ones
+            films = None
+            print("- Not saving the checkpoint, the next run needs to be a full (resumed) export")
+
+    # Remember what was exported so the next run can be incremental
+    if films is not None:
+        save_checkpoint(username, films)
     
-    # Optionally crawl the watchlist
+    # Optionally crawl the watchlist into a separate CSV
     if scrape_watchlist:
-        watchlist_urls = crawl_watchlist(username)
-        watchlist_data = crawl_detailed_movie_pages(watchlist_urls)
-        # Save the watchlist to a separate CSV
-        save_to_csv(watchlist_data, csv_file=watchlist_csv_file)
-
-    # Save the watched movies data to CSV
-    save_to_csv(movie_data, ratings_data)
+        watchlist_url = f"https://letterboxd.com/{username}/watchlist"
+        crawl_to_csv(watchlist_url, csv_file=watchlist_csv_file)
 
+    engine.close()
+    engine.report()
+    tmdb_cache.report()
+    report_connections()
     print("Script finished.")
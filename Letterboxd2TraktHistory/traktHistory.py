@@ -1,13 +1,22 @@
-import requests
 import pandas as pd
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
-import time
+import sys
 import webbrowser
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, get_client, report_endpoints
+from traktSync import sync_items
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
+
+# History lookups in flight at once while double-checking an import (GETs, paced by the read limit)
+recheck_workers = 8
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -55,7 +64,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -67,15 +76,9 @@ def authenticate_trakt():
         print(f"Error authenticating with Trakt: {response.status_code} - {response.text}")
         exit()
 
-# Function to mark movies and shows as watched on Trakt in a batch request, with retry mechanism
-def mark_watched_batch(movies, shows, watched_at, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to mark movies and shows as watched on Trakt, sent in chunks. Returns the SyncResult
+def mark_watched_batch(movies, shows, watched_at, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     # Prepare the payload for batch marking movies and shows
     payload = {
@@ -83,41 +86,20 @@ def mark_watched_batch(movies, shows, watched_at, access_token, client_id, retri
         "shows": [{"ids": {"tmdb": show_id}, "watched_at": watched_at} for show_id in shows]
     }
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 201:
-            print("Successfully marked all movies and shows as watched in one request.")
-            return True
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to mark items as watched. Response: {response.status_code} - {response.text}")
-            return False
-
-    print(f"Failed to mark items after {retries} attempts due to rate limits.")
-    return False
+    result = sync_items(client, "/sync/history", payload)
+    result.report("Marked as watched")
+    return result
 
 # Function to mark movies as rated on Trakt
 def import_ratings(movies_with_ratings, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/ratings"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
     # Prepare the payload for movies ratings
     payload = {
         "movies": [{"ids": {"tmdb": movie_id}, "rating": rating} for movie_id, rating in movies_with_ratings.items()]
     }
 
-    response = requests.post(trakt_url, headers=headers, json=payload)
+    response = client.post("/sync/ratings", payload)
     
     if response.status_code == 201:
         print("Successfully imported ratings.")
@@ -128,13 +110,7 @@ def import_ratings(movies_with_ratings, access_token, client_id):
 
 # Function to import movies to the user's watchlist
 def import_watchlist(movies, shows, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
     # Prepare the payload for watchlist import
     payload = {
@@ -142,7 +118,7 @@ def import_watchlist(movies, shows, access_token, client_id):
         "shows": [{"ids": {"tmdb": show_id}} for show_id in shows]
     }
 
-    response = requests.post(trakt_url, headers=headers, json=payload)
+    response = client.post("/sync/watchlist", payload)
 
     if response.status_code == 201:
         print("Successfully imported watchlist.")
@@ -179,59 +155,61 @@ def process_csv(file_path):
     
     return movies, shows, letterboxd_urls, movies_with_ratings
 
-# Function to retrieve watched history from Trakt
-def retrieve_trakt_history(access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
-
-    all_history = []
-    page = 1
-    while True:
-        response = requests.get(f"{trakt_url}?page={page}&limit=1000", headers=headers)
-        if response.status_code != 200:
-            print(f"Failed to retrieve watched history from Trakt. Response: {response.status_code} - {response.text}")
-            return None
-
-        page_data = response.json()
-        if not page_data:
-            break  # No more history to fetch
-        all_history.extend(page_data)
-        page += 1
-
-    return all_history
-
-# Function to compare the CSV and Trakt history
-def compare_csv_and_history(csv_movies, csv_shows, trakt_history, letterboxd_urls):
-    # Extract the TMDb IDs from the Trakt history
-    trakt_movie_ids = []
-    trakt_show_ids = []
-
-    for item in trakt_history:
-        if 'movie' in item:
-            trakt_movie_ids.append(item['movie']['ids']['tmdb'])
-        elif 'show' in item:
-            trakt_show_ids.append(item['show']['ids']['tmdb'])
-
-    # Compare CSV movies with Trakt movie history
-    missing_movies = [movie for movie in csv_movies if movie not in trakt_movie_ids]
-
-    # Compare CSV shows with Trakt show history
-    missing_shows = [show for show in csv_shows if show not in trakt_show_ids]
-
-        # Report missing items
-    if missing_movies or missing_shows:
+# Function to report the items that weren't marked as watched, straight from the import's responses:
+# what Trakt listed as not_found, plus anything in a request that kept failing. Returns them as (type, TMDb ID)
+def report_not_marked(result, letterboxd_urls):
+    missing = [('movie', item['ids'].get('tmdb')) for item in result.not_found.get('movies', [])]
+    missing += [('show', item['ids'].get('tmdb')) for item in result.not_found.get('shows', [])]
+    for chunk, error in result.failed:
+        missing += [('movie', item['ids']['tmdb']) for item in chunk.get('movies', [])]
+        missing += [('show', item['ids']['tmdb']) for item in chunk.get('shows', [])]
+
+    # Report missing items
+    if missing:
         print("\nThe following items were not marked as watched on Trakt:")
-        for tmdb_id in missing_movies:
-            print(f"Missing Movie - TMDb ID: {tmdb_id}, Letterboxd URL: {letterboxd_urls.get(tmdb_id, 'N/A')}")
-        for tmdb_id in missing_shows:
-            print(f"Missing Show - TMDb ID: {tmdb_id}, Letterboxd URL: {letterboxd_urls.get(tmdb_id, 'N/A')}")
+        for media_type, tmdb_id in missing:
+            print(f"Missing {media_type.title()} - TMDb ID: {tmdb_id}, Letterboxd URL: {letterboxd_urls.get(tmdb_id, 'N/A')}")
     else:
         print("All items were successfully marked as watched on Trakt.")
+    return missing
+
+# Function to check that a movie or show has watched history on Trakt: the TMDb ID is looked up to get
+# its Trakt ID, then a single history entry is asked for. None when the check itself failed
+def has_history(client, media_type, tmdb_id):
+    response = client.get(f"/search/tmdb/{int(tmdb_id)}?type={media_type}")
+    if response.status_code != 200:
+        return None
+    matches = [result[media_type] for result in response.json() if result.get('type') == media_type]
+    if not matches:
+        return False
+
+    response = client.get(f"/sync/history/{media_type}s/{matches[0]['ids']['trakt']}?limit=1")
+    if response.status_code != 200:
+        return None
+    return bool(response.json())
+
+# Function to double-check the submitted items that Trakt reported as added, two requests per item
+# (instead of downloading the whole history), several checks at once under the read limit
+def recheck_watched(movies, shows, missing, letterboxd_urls, access_token, client_id):
+    client = get_client(access_token, client_id)
+
+    # Items without a TMDb ID can't be looked up
+    reported = set(missing)
+    submitted = [('movie', movie) for movie in movies] + [('show', show) for show in shows]
+    to_check = [item for item in submitted if item not in reported and pd.notna(item[1])]
+    print(f"Double-checking {len(to_check)} items on Trakt...")
+
+    with ThreadPoolExecutor(max_workers=recheck_workers) as executor:
+        checks = list(executor.map(lambda item: has_history(client, *item), to_check))
+
+    not_watched = [item for item, watched in zip(to_check, checks) if watched is False]
+    unchecked = sum(1 for watched in checks if watched is None)
+    for media_type, tmdb_id in not_watched:
+        print(f"Not in history - {media_type.title()} TMDb ID: {tmdb_id}, Letterboxd URL: {letterboxd_urls.get(tmdb_id, 'N/A')}")
+    if unchecked:
+        print(f"{unchecked} items couldn't be checked.")
+    if not not_watched and not unchecked:
+        print("Every item is in your Trakt history.")
 
 # Main function to run the script
 if __name__ == "__main__":
@@ -259,21 +237,21 @@ if __name__ == "__main__":
     print("Do you want to import your watchlist as well?")
     import_watchlist_choice = input("Type 'yes' or 'no': ").strip().lower()
 
+    # Ask if the user wants every item checked on Trakt after the import (Trakt's responses are checked either way)
+    print("Do you want to double-check every item on Trakt afterwards? (2 requests per item)")
+    recheck_choice = input("Type 'yes' or 'no': ").strip().lower()
+
     # Use the .csv file with TMDB IDs and ratings
     csv_file_path = 'watched_movies_tmdb.csv'  # Make sure this path is correct
     movies, shows, letterboxd_urls, movies_with_ratings = process_csv(csv_file_path)
 
-    # Mark movies/shows as watched
-    if mark_watched_batch(movies, shows, watched_at, access_token, client_id):
-        print("Waiting 5 seconds for Trakt to update the history...")
-        time.sleep(5)  # Wait for a few seconds to allow Trakt to update the history
-
-        # Retrieve watched history from Trakt
-        trakt_history = retrieve_trakt_history(access_token, client_id)
+    # Mark movies/shows as watched and report what Trakt didn't add
+    result = mark_watched_batch(movies, shows, watched_at, access_token, client_id)
+    missing = report_not_marked(result, letterboxd_urls)
 
-        if trakt_history:
-            # Compare CSV items with Trakt history
-            compare_csv_and_history(movies, shows, trakt_history, letterboxd_urls)
+    # Optionally check the rest on Trakt itself
+    if recheck_choice == 'yes':
+        recheck_watched(movies, shows, missing, letterboxd_urls, access_token, client_id)
 
     # If the user chose to import ratings
     if import_ratings_choice == 'yes' and movies_with_ratings:
@@ -296,4 +274,6 @@ if __name__ == "__main__":
     else:
         print("Skipping watchlist import.")
 
+    report_endpoints()
+    report_connections()
     print("All items have been processed.")
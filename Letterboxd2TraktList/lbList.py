@@ -1,141 +1,109 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import sys
+
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from lbCache import TmdbCache
+import lbExtract
+from crawlEngine import CrawlEngine, OrderedCollector, FETCH_ERRORS
+from crawlJournal import CrawlJournal, journal_path
+from httpCache import HttpCache
+from lbPaginator import Paginator
+from httpSession import report_connections
 
 # Define the header for the output CSV
 csv_file = "list.csv"
-csv_header = ["Letterboxd URL", "TMDB ID", "Type"]
+csv_header = ["Position", "Letterboxd URL", "TMDB ID", "Type"]
 
-# Function to extract movie URLs from the main list page
-def extract_movie_urls(page_url):
-    response = requests.get(page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    movie_data = []
-    
-    # Get all movie containers (list items)
-    movie_items = soup.find_all('li', class_='poster-container')
-    
-    for li in movie_items:
-        # Find the movie URL from the 'data-target-link' attribute
-        lazy_load_div = li.find('div', class_='really-lazy-load')
-        
-        if lazy_load_div and lazy_load_div.get('data-target-link'):
-            movie_url = "https://letterboxd.com" + lazy_load_div['data-target-link']
-            movie_data.append(movie_url)
-    
-    return movie_data
+# Maximum number of Letterboxd requests in flight at once
+max_concurrency = 100
 
-# Function to extract TMDb info from the detailed movie page
-def extract_tmdb_info(movie_url):
-    response = requests.get(movie_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    # Find the TMDb button by class and text content
-    tmdb_button = soup.find('a', class_='micro-button track-event', string='TMDb')
-    
-    if tmdb_button:
-        tmdb_link = tmdb_button.get('href')
-        
-        # Extract TMDB ID and type (movie or tv)
-        if "/movie/" in tmdb_link:
-            tmdb_id = tmdb_link.split("/movie/")[1].strip("/")
-            media_type = "movie"
-        elif "/tv/" in tmdb_link:
-            tmdb_id = tmdb_link.split("/tv/")[1].strip("/")
-            media_type = "show"
-        else:
-            tmdb_id = None
-            media_type = None
-        
-        return movie_url, tmdb_id, media_type
-    else:
-        return movie_url, None, None
-
-# Function to find the last page number by parsing pagination
-def get_last_page(base_url):
-    first_page_url = base_url + "/page/1/"
-    response = requests.get(first_page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Find pagination container
-    pagination = soup.find('div', class_='paginate-pages')
-    
-    if pagination:
-        # Find the last page number by looking for the last link in the pagination
-        last_page_link = pagination.find_all('a')[-1].get('href')
-        last_page_number = int(last_page_link.split('/page/')[-1].strip('/'))
-    else:
-        # If no pagination is found, we assume there's only one page
-        last_page_number = 1
-
-    return last_page_number
-
-# Function to crawl multiple pages using ThreadPoolExecutor
-def crawl_list_movies(last_page, base_url):
-    all_movie_urls = []  # List to store URLs in the correct order
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = []
-        for page in range(1, last_page + 1):
-            page_url = base_url + f"/page/{page}/"
-            futures.append(executor.submit(extract_movie_urls, page_url))
-        
-        # Progress feedback
-        print("- Extracting movies from pages")
-        
-        # Collect the results in the correct order
-        for future in futures:
-            movie_urls = future.result()
-            all_movie_urls.extend(movie_urls)  # Extend instead of as_completed to preserve order
-    
-    return all_movie_urls
+# Worker processes for HTML parsing (0 = parse in the main process), see Common/parseBenchmark.py
+parse_processes = lbExtract.default_parse_processes()
 
+# Persistent Letterboxd film -> TMDB ID cache shared with the other Letterboxd scrapers
+tmdb_cache = TmdbCache()
 
-# Function to crawl detailed movie pages for TMDb links, ensuring order is maintained
-def crawl_detailed_movie_pages(movie_urls):
-    all_movie_data = [None] * len(movie_urls)  # Initialize list with None to preserve order
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = {executor.submit(extract_tmdb_info, movie_url): idx for idx, movie_url in enumerate(movie_urls)}
-        
-        # Progress feedback
-        print("- Gathering TMDB Ids")
-        
-        # Collect the results in the correct order based on index
-        for future in futures:
-            idx = futures[future]  # Ensure we're getting the right index for each result
-            try:
-                result = future.result()
-                all_movie_data[idx] = result  # Place result at the correct index
-            except Exception as e:
-                print(f"Error extracting TMDB info: {e}")
-    
-    return all_movie_data
+# Shared asyncio crawl engine used for every Letterboxd request (listing pages are revalidated
+# against the on-disk HTTP cache instead of being downloaded again)
+engine = CrawlEngine(concurrency=max_concurrency, http_cache=HttpCache(), parse_processes=parse_processes)
+
+# Function to extract movie URLs from the main list page (page.data is filled by lbExtract.extract_movie_urls)
+def extract_movie_urls(page):
+    return page.data
+
+# Function to crawl the list pages and the film pages as one streaming pipeline, writing each movie to
+# the CSV in list order with its rank. Pages and movies also go into the journal as they finish, and
+# pages already in it (when resuming) are not fetched again. Returns whether every page and movie was crawled
+def crawl_list_to_csv(paginator, journal):
+    last_page = paginator.count_pages()
+    page_numbers = [page for page in range(1, last_page + 1) if page not in journal.pages]
+    page_urls = paginator.page_urls(page_numbers)
 
+    # Movies from journaled pages that hadn't been resolved yet
+    pending = [
+        ((page_number, index), movie_url)
+        for page_number, movie_urls in journal.pages.items()
+        for index, movie_url in enumerate(movie_urls)
+        if movie_url not in journal.resolved
+    ]
 
-# Function to save the extracted data to a CSV file
-def save_to_csv(movie_data):
     with open(csv_file, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(csv_header)
-        writer.writerows(movie_data)
-    
+
+        # Movies finish in any order, the collector holds back the few that are ahead of their turn
+        def write_movie(rank, movie):
+            writer.writerow([rank] + list(movie))
+
+        collector = OrderedCollector(range(1, last_page + 1), write_movie)
+
+        # Replay what the interrupted run already resolved, it comes first in the list order anyway
+        for page_number, movie_urls in journal.pages.items():
+            collector.page_done(page_number, len(movie_urls))
+        for film in journal.films():
+            collector.add(film['position'], (film['url'], film['tmdb_id'], film['media_type']))
+
+        def extract_and_journal_movie_urls(page):
+            movie_urls = extract_movie_urls(page)
+            journal.add_page(lbExtract.parse_page_link(page.url), movie_urls)
+            return movie_urls
+
+        def journal_movie(position, movie):
+            movie_url, tmdb_id, media_type = movie
+            journal.add_film(movie_url, tmdb_id=tmdb_id, media_type=media_type, position=position)
+            collector.add(position, movie)
+
+        # Progress feedback
+        print("- Extracting movies and gathering TMDB Ids")
+
+        failed = engine.pipeline(page_urls, extract_and_journal_movie_urls, tmdb_cache.movie_from_page, journal_movie,
+                                 lookup=tmdb_cache.cached_movie, page_numbers=page_numbers, pending=pending, ordered=True,
+                                 on_page=collector.page_done, on_skip=collector.skip,
+                                 extract_listing=lbExtract.extract_movie_urls, extract_detail=lbExtract.extract_tmdb_info)
+        collector.close()
+
     # Feedback after saving
-    print(f"- Movies/shows saved to {csv_file}")
+    print(f"- Movies/shows saved to {csv_file} (at most {collector.peak_buffered} held back for ordering)")
+    if collector.stopped_at is not None:
+        # Later ranks depend on how many movies the failed page has, resuming fetches it and writes the rest
+        print(f"- Page {collector.stopped_at} failed, the CSV stops before it. Run the script again and resume to finish it")
+    return not failed and paginator.complete
 
 # Function to get the Letterboxd list URL and validate it
 def get_letterboxd_list_url():
     while True:
         list_url = input("Enter the Letterboxd list URL (e.g., https://letterboxd.com/username/list/some-list/): ").strip()
 
-        # Validate the URL by trying to access the first page
+        # Validate the URL with the first page, which the crawl reuses instead of downloading it again
         try:
-            response = requests.get(list_url)
-            if response.status_code == 200:
+            page = Paginator(engine, list_url).open()
+            if page.ok:
                 return list_url
             else:
                 print(f"Invalid URL or the page doesn't exist. Please try again.")
-        except requests.RequestException:
+        except FETCH_ERRORS:
             print("Error accessing the page. Please check your internet connection and try again.")
 
 # Main function to run the script
@@ -143,16 +111,30 @@ if __name__ == "__main__":
     # Get the user's Letterboxd list URL
     base_url = get_letterboxd_list_url()
     
-    # Find the last page number
-    last_page = get_last_page(base_url)
-    
-    # Crawl all pages to collect movie URLs
-    movie_urls = crawl_list_movies(last_page, base_url)
-    
-    # Crawl detailed movie pages to extract TMDb links (preserving order)
-    movie_data = crawl_detailed_movie_pages(movie_urls)
+    # Offer to pick up where an interrupted crawl of the same list stopped
+    journal = CrawlJournal(journal_path(csv_file), {'url': base_url})
+    resume = journal.can_resume() and input("A previous crawl of this list didn't finish. Resume it? (yes/no): ").strip().lower() == "yes"
+    journal.open(resume)
+
+    # Find the last page number (page 1 was already downloaded to validate the URL)
+    paginator = Paginator(engine, base_url)
+    paginator.count_pages()
     
-    # Save the data to CSV
-    save_to_csv(movie_data)
+    # Crawl all pages and their detailed movie pages to extract TMDb links, saving them in list order
+    try:
+        finished = crawl_list_to_csv(paginator, journal)
+    except BaseException:
+        journal.close(finished=False)
+        print("- Crawl interrupted, run the script again to resume it")
+        raise
+
+    # Keep the journal when pages failed (or the page count is incomplete), so a rerun can resume and fetch just those
+    journal.close(finished)
+    if not finished:
+        print("- Some pages failed, run the script again and resume to retry just those")
 
+    engine.close()
+    engine.report()
+    tmdb_cache.report()
+    report_connections()
     print("Script finished.")
@@ -1,105 +1,139 @@
 import csv
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import math
+import os
+import sys
 
-# Prompt the user for the Letterboxd list URL and the number of movies to scrape
-list_url = input("Enter the Letterboxd list URL: ")
-num_movies = int(input("Enter the number of movies to scrape: "))
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from lbCache import TmdbCache
+import lbExtract
+from crawlEngine import CrawlEngine, FETCH_ERRORS
+from httpCache import HttpCache
+from lbPaginator import page_url
+from httpSession import report_connections
+
+# Maximum number of Letterboxd requests in flight at once
+max_concurrency = 100
+
+# Worker processes for HTML parsing (0 = parse in the main process), see Common/parseBenchmark.py
+parse_processes = lbExtract.default_parse_processes()
 
 # Assuming 72 movies per page
 movies_per_page = 72
 
-# Calculate how many pages are required to scrape the specified number of movies
-num_pages = math.ceil(num_movies / movies_per_page)
-
-# Set up Selenium to run in headless mode (in the background)
-chrome_options = Options()
-chrome_options.add_argument("--headless")  # Run in headless mode
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--no-sandbox")
+# Persistent Letterboxd film -> TMDB ID cache shared with the other Letterboxd scrapers
+tmdb_cache = TmdbCache()
+
+# Shared asyncio crawl engine used for the listing and film detail pages (listing pages are
+# revalidated against the on-disk HTTP cache instead of being downloaded again)
+engine = CrawlEngine(concurrency=max_concurrency, http_cache=HttpCache(), parse_processes=parse_processes)
+
+# Function to extract the movie URLs from a popular/list page, in the order they are shown
+def extract_film_links(page):
+    return lbExtract.extract_film_links(page.body)
+
+# Function to get the AJAX fragment a browser loads the posters of a /films/ page from, None for other pages
+def get_ajax_url(list_url):
+    films_prefix = f"{lbExtract.LETTERBOXD_URL}/films/"
+    if list_url.startswith(films_prefix) and not list_url.startswith(films_prefix + "ajax/"):
+        return films_prefix + "ajax/" + list_url[len(films_prefix):]
+    return None
+
+# Function to number the movies found on consecutive pages, stopping at the number of movies asked for
+def number_movies(pages_of_links, num_movies):
+    movie_urls = [movie_url for page_links in pages_of_links for movie_url in page_links]
+    return [(movie_url, position) for position, movie_url in enumerate(movie_urls[:num_movies], 1)]
+
+# Function to scrape movie URLs and their positions over plain HTTP. Page 1 decides between the page
+# itself and its AJAX fragment (for pages that only fill in their posters with JavaScript), then
+# every other page is fetched concurrently. Positions stop before the first page that failed, the
+# movies after it can't be numbered without knowing how many it held
+def crawl_positions_http(list_url, num_movies):
+    num_pages = math.ceil(num_movies / movies_per_page)
+
+    for base_url in filter(None, [list_url, get_ajax_url(list_url)]):
+        try:
+            page = engine.get(page_url(base_url, 1), cached=True)
+        except FETCH_ERRORS as e:
+            print(f"Error fetching {page_url(base_url, 1)}: {e!r}")
+            continue
+        first_page_links = extract_film_links(page) if page.ok else []
+        if first_page_links:
+            break
+    else:
+        return []
+
+    page_urls = [page_url(base_url, page_num) for page_num in range(2, num_pages + 1)]
+    pages_of_links = [first_page_links]
+    for page_num, links in enumerate(engine.map(page_urls, extract_film_links, cached=True), 2):
+        if links is None:
+            print(f"- Page {page_num} failed, only the {sum(map(len, pages_of_links))} movies before it are numbered")
+            break
+        pages_of_links.append(links)
+    return number_movies(pages_of_links, num_movies)
 
-# Initialize the headless browser driver
-driver = webdriver.Chrome(options=chrome_options)
+# Function to scrape movie URLs and their positions with a headless browser (opt-in fallback)
+def crawl_positions_selenium(list_url, num_movies):
+    # Only imported when asked for, so the HTTP mode works without Selenium/Chrome installed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
 
-# Function to extract TMDb info from the detailed movie page
-def extract_tmdb_info(movie_url):
-    try:
-        response = requests.get(movie_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find the TMDb button by class and text content
-        tmdb_button = soup.find('a', class_='micro-button track-event', string='TMDb')
-        
-        if tmdb_button:
-            tmdb_link = tmdb_button.get('href')
-            
-            # Extract TMDB ID and type (movie or tv)
-            if "/movie/" in tmdb_link:
-                tmdb_id = tmdb_link.split("/movie/")[1].strip("/")
-                media_type = "movie"
-            elif "/tv/" in tmdb_link:
-                tmdb_id = tmdb_link.split("/tv/")[1].strip("/")
-                media_type = "show"
-            else:
-                tmdb_id = None
-                media_type = None
-        else:
-            tmdb_id = None
-            media_type = None
-        
-        return movie_url, tmdb_id, media_type
-    except Exception as e:
-        return movie_url, None, None
-
-# Open the Letterboxd list URL
-driver.get(list_url)
-
-# Wait for the page to load
-driver.implicitly_wait(10)
-
-# List to hold all movie URLs in the correct order with their position
-movies_with_positions = []
-
-# Scrape movie URLs and their positions from each page
-for page_num in range(1, num_pages + 1):
-    driver.get(f"{list_url}page/{page_num}/")
-    
-    # Find all movies on the page using a generalized XPath
-    movie_elements = driver.find_elements(By.XPATH, '//ul/li/div[@data-film-link]')
-    
-    # Extract the data-film-link attribute and the position for each movie
-    for idx, movie_element in enumerate(movie_elements):
-        movie_url = 'https://letterboxd.com' + movie_element.get_attribute('data-film-link')
-        movie_position = (page_num - 1) * len(movie_elements) + (idx + 1)
-        movies_with_positions.append((movie_url, movie_position))
-        
-        # Stop scraping when we've reached the desired number of movies
-        if len(movies_with_positions) >= num_movies:
-            break
+    num_pages = math.ceil(num_movies / movies_per_page)
 
-    # Stop if we have already gathered enough movies
-    if len(movies_with_positions) >= num_movies:
-        break
+    # Set up Selenium to run in headless mode (in the background)
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")  # Run in headless mode
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
 
-# Close the browser after fetching the URLs
-driver.quit()
+    # Initialize the headless browser driver
+    driver = webdriver.Chrome(options=chrome_options)
+    driver.implicitly_wait(10)
 
-# List to hold all movies with their TMDb data
-movies_with_tmdb = []
+    pages_of_links = []
+    try:
+        for page_num in range(1, num_pages + 1):
+            driver.get(page_url(list_url, page_num))
+
+            # Find all movies on the page using a generalized XPath
+            movie_elements = driver.find_elements(By.XPATH, '//ul/li/div[@data-film-link]')
+            pages_of_links.append([
+                lbExtract.LETTERBOXD_URL + movie_element.get_attribute('data-film-link')
+                for movie_element in movie_elements
+            ])
+
+            # Stop if we have already gathered enough movies
+            if sum(len(page_links) for page_links in pages_of_links) >= num_movies:
+                break
+    finally:
+        # Close the browser after fetching the URLs
+        driver.quit()
+
+    return number_movies(pages_of_links, num_movies)
+
+# Function to look up the TMDb data for every movie, cache first, keeping the list positions
+def get_movies_with_tmdb(movies_with_positions):
+    movies_with_tmdb = []
+
+    # Films already in the TMDB cache don't need their page downloaded
+    movies_to_fetch = []
+    for url, position in movies_with_positions:
+        cached = tmdb_cache.get(url)
+        if cached is not None:
+            movies_with_tmdb.append({
+                'position': position,
+                'letterboxd_url': url,
+                'tmdb_id': cached[0],
+                'media_type': cached[1]
+            })
+        else:
+            movies_to_fetch.append((url, position))
 
-# Use ThreadPoolExecutor for concurrent scraping of TMDb data
-with ThreadPoolExecutor(max_workers=10) as executor:
-    # Start scraping TMDb data concurrently
-    future_to_movie = {executor.submit(extract_tmdb_info, url): (url, position) for url, position in movies_with_positions}
-    
-    for future in as_completed(future_to_movie):
-        movie_url, tmdb_id, media_type = future.result()
-        url, position = future_to_movie[future]
+    # Scrape the remaining TMDb data concurrently through the crawl engine
+    results = engine.map([url for url, position in movies_to_fetch], tmdb_cache.movie_from_page, extract=lbExtract.extract_tmdb_info)
+    for (url, position), result in zip(movies_to_fetch, results):
+        movie_url, tmdb_id, media_type = result or (url, None, None)
         movies_with_tmdb.append({
             'position': position,
             'letterboxd_url': url,
@@ -107,23 +141,46 @@ with ThreadPoolExecutor(max_workers=10) as executor:
             'media_type': media_type
         })
 
-# Sort movies based on their original position
-movies_with_tmdb.sort(key=lambda x: x['position'])
-
-# CSV header and file writing
-csv_header = ["Position", "Letterboxd URL", "TMDB ID", "Type"]
-
-with open('list.csv', mode='w', newline='') as file:
-    writer = csv.DictWriter(file, fieldnames=csv_header)
-    writer.writeheader()
-    
-    # Write each movie's data to the CSV file
-    for movie in movies_with_tmdb:
-        writer.writerow({
-            "Position": movie['position'],
-            "Letterboxd URL": movie['letterboxd_url'],
-            "TMDB ID": movie['tmdb_id'],
-            "Type": movie['media_type']
-        })
-
-print(f"Data saved to list.csv with {len(movies_with_tmdb)} movies.")
+    # Sort movies based on their original position
+    movies_with_tmdb.sort(key=lambda x: x['position'])
+    return movies_with_tmdb
+
+# Function to save the movies to list.csv
+def save_to_csv(movies_with_tmdb):
+    # CSV header and file writing
+    csv_header = ["Position", "Letterboxd URL", "TMDB ID", "Type"]
+
+    with open('list.csv', mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=csv_header)
+        writer.writeheader()
+
+        # Write each movie's data to the CSV file
+        for movie in movies_with_tmdb:
+            writer.writerow({
+                "Position": movie['position'],
+                "Letterboxd URL": movie['letterboxd_url'],
+                "TMDB ID": movie['tmdb_id'],
+                "Type": movie['media_type']
+            })
+
+    print(f"Data saved to list.csv with {len(movies_with_tmdb)} movies.")
+
+# Main function to run the script
+if __name__ == "__main__":
+    # Prompt the user for the Letterboxd list URL and the number of movies to scrape
+    list_url = input("Enter the Letterboxd list URL: ").strip()
+    num_movies = int(input("Enter the number of movies to scrape: "))
+
+    # Scrape movie URLs and their positions, falling back to a headless browser only if asked to
+    movies_with_positions = crawl_positions_http(list_url, num_movies)
+    if not movies_with_positions:
+        print("No movies found over HTTP (the page may need JavaScript to show its posters).")
+        if input("Do you want to retry with a headless Chrome browser? Needs Selenium (yes/no): ").strip().lower() == "yes":
+            movies_with_positions = crawl_positions_selenium(list_url, num_movies)
+
+    save_to_csv(get_movies_with_tmdb(movies_with_positions))
+
+    engine.close()
+    engine.report()
+    tmdb_cache.report()
+    report_connections()
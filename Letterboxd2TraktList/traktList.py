@@ -1,12 +1,16 @@
-import requests
 import pandas as pd
 import json
 import os
-import time
+import sys
 import webbrowser
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, get_client, report_endpoints
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -54,7 +58,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -70,12 +74,7 @@ def create_trakt_list(access_token, client_id):
     list_description = input("Enter the description for the Trakt list: ").strip()
     is_public = input("Should this list be public? (yes/no): ").strip().lower() == 'yes'
     
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
     
     # Payload for creating the list
     payload = {
@@ -86,7 +85,7 @@ def create_trakt_list(access_token, client_id):
         "allow_comments": True
     }
     
-    response = requests.post(f"{TRAKT_BASE_URL}/users/me/lists", headers=headers, json=payload)
+    response = client.post("/users/me/lists", payload)
     
     if response.status_code == 201:
         list_slug = response.json()['ids']['slug']
@@ -98,13 +97,7 @@ def create_trakt_list(access_token, client_id):
 
 # Function to remove all items from a Trakt list
 def remove_all_items_from_trakt_list(list_slug, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items/remove"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
     # Retrieve the current list of items from Trakt
     list_items = retrieve_trakt_list(list_slug, access_token, client_id)
@@ -125,7 +118,7 @@ def remove_all_items_from_trakt_list(list_slug, access_token, client_id):
         return
     
     # Send the request to remove the items
-    response = requests.post(trakt_url, headers=headers, json=payload)
+    response = client.post(f"/users/me/lists/{list_slug}/items/remove", payload)
     
     if response.status_code == 200:
         print("Successfully removed all items from the list.")
@@ -133,15 +126,14 @@ def remove_all_items_from_trakt_list(list_slug, access_token, client_id):
         print(f"Failed to remove items from the list. Response: {response.status_code} - {response.text}")
 
 
-# Function to add items to the Trakt list in batch with rank assignment
-def add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to tell whether a CSV item can be sent to Trakt (films without a TMDb link have no TMDB ID or Type)
+def has_tmdb_id(item):
+    return item['type'] in ('movie', 'show') and pd.notna(item['tmdb_id'])
+
+# Function to add items to the Trakt list in batch with rank assignment. Returns Trakt's response
+# (added/existing/not_found), None when the items couldn't be added
+def add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     # Prepare the payload for adding items in the exact order with rank
     payload = {
@@ -149,10 +141,10 @@ def add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id,
         "shows": []
     }
     
-    for item in items:
+    for item in filter(has_tmdb_id, items):
         if item['type'] == 'movie':
             payload['movies'].append({"ids": {"tmdb": item['tmdb_id']}, "rank": item['rank']})
-        elif item['type'] == 'show':
+        else:
             payload['shows'].append({"ids": {"tmdb": item['tmdb_id']}, "rank": item['rank']})
 
     # Ensure the payload is not empty
@@ -160,38 +152,21 @@ def add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id,
         print(f"No valid items found to add to list {list_slug}.")
         return None
 
-    attempt = 0
+    response = client.post(f"/users/me/lists/{list_slug}/items", payload)
 
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 201:
-            print(f"Successfully added all items (movies and shows) to the list in the correct order with ranks.")
-            return response.status_code
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to add items to the list. Response: {response.status_code} - {response.text}")
-            return None
-
-    print(f"Failed to add items after {retries} attempts due to rate limits.")
-    return None
+    if response.status_code == 201:
+        print(f"Successfully added the items (movies and shows) to the list in the correct order with ranks.")
+        return response.json()
+    else:
+        print(f"Failed to add items to the list. Response: {response.status_code} - {response.text}")
+        return None
 
 
-# Function to retrieve the list from Trakt after adding items
+# Function to retrieve the items of a Trakt list
 def retrieve_trakt_list(list_slug, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get(f"/users/me/lists/{list_slug}/items")
     
     if response.status_code == 200:
         return response.json()  # Return the list items
@@ -199,65 +174,46 @@ def retrieve_trakt_list(list_slug, access_token, client_id):
         print(f"Failed to retrieve list items from Trakt. Response: {response.status_code} - {response.text}")
         return None
 
-# Function to reorder items in the Trakt list to match the CSV order
-def reorder_trakt_list(list_slug, items, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items/reorder"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to reorder items in the Trakt list to match the CSV order, from the list items retrieved once after adding
+def reorder_trakt_list(list_slug, items, list_items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    # Retrieve the current list of items from Trakt
-    list_items = retrieve_trakt_list(list_slug, access_token, client_id)
-    
-    # Map the item ranks based on the CSV file order
-    item_order = []
-    for item in items:
-        for trakt_item in list_items:
-            if 'movie' in trakt_item and trakt_item['movie']['ids']['tmdb'] == item['tmdb_id']:
-                item_order.append(trakt_item['id'])
-            elif 'show' in trakt_item and trakt_item['show']['ids']['tmdb'] == item['tmdb_id']:
-                item_order.append(trakt_item['id'])
-
-        # Prepare the payload for reordering
+    # Map the list entries by TMDb ID, then rank them based on the CSV file order
+    entry_ids = {}
+    for trakt_item in list_items:
+        for media_type in ('movie', 'show'):
+            if media_type in trakt_item:
+                entry_ids.setdefault(trakt_item[media_type]['ids']['tmdb'], trakt_item['id'])
+    item_order = [entry_ids[item['tmdb_id']] for item in items if item['tmdb_id'] in entry_ids]
+
+    # Prepare the payload for reordering
     payload = {
         "rank": item_order  # Use the order from CSV to rank items
     }
 
     # Send the reorder request
-    response = requests.post(trakt_url, headers=headers, json=payload)
+    response = client.post(f"/users/me/lists/{list_slug}/items/reorder", payload)
     
     if response.status_code == 200:
         print("Successfully reordered the list to match the CSV order.")
     else:
         print(f"Failed to reorder the list. Response: {response.status_code} - {response.text}")
 
-# Function to compare the items in the CSV with those in the Trakt list and show missing items with their rank
-def compare_trakt_and_csv(csv_items, trakt_items, letterboxd_urls):
-    # Extract the TMDb IDs from the Trakt list items
-    trakt_ids = []
-    for item in trakt_items:
-        if 'movie' in item:
-            trakt_ids.append(item['movie']['ids']['tmdb'])
-        elif 'show' in item:
-            trakt_ids.append(item['show']['ids']['tmdb'])
-
-    # Compare the CSV items with the Trakt list
-    missing_items = []
-    for item in csv_items:
-        if item['tmdb_id'] not in trakt_ids:
-            missing_items.append(item)
+# Function to show the CSV items that didn't make it into the list with their rank: the ones that were never
+# sent (no TMDB ID or Type in the CSV) and the ones in the not_found part of Trakt's add response
+def report_not_added(csv_items, added):
+    not_found = added.get('not_found', {})
+    not_found_ids = {item['ids'].get('tmdb') for section in ('movies', 'shows') for item in not_found.get(section, [])}
+    missing_items = [item for item in csv_items if not has_tmdb_id(item) or item['tmdb_id'] in not_found_ids]
 
     # Report missing items with their rank (position)
     if missing_items:
         print("\nThe following items were not added to the Trakt list:")
         for item in missing_items:
-            tmdb_id = item['tmdb_id']
+            tmdb_id = item['tmdb_id'] if has_tmdb_id(item) else 'none'
             rank = item['rank']  # Get the rank from the CSV
-            print(f"TMDb ID: {tmdb_id}, Rank: {rank}, Letterboxd URL: {letterboxd_urls.get(tmdb_id, 'No URL found')}")
-        print("\nYou may need to add these items manually, as they do not exist on Trakt.")
+            print(f"TMDb ID: {tmdb_id}, Rank: {rank}, Letterboxd URL: {item['letterboxd_url']}")
+        print("\nYou may need to add these items manually, as they have no TMDb ID or do not exist on Trakt.")
     else:
         print("All items were successfully added to the Trakt list.")
 
@@ -266,24 +222,25 @@ def compare_trakt_and_csv(csv_items, trakt_items, letterboxd_urls):
 def process_csv_with_rank(file_path):
     data = pd.read_csv(file_path)
 
-    # Collect items with their rank
+    # Collect items with their rank and Letterboxd URL
     items = []
-    letterboxd_urls = {}  # Map TMDB ID to Letterboxd URL
 
     for index, row in data.iterrows():
-        tmdb_id = row['TMDB ID']
+        # The column is read as floats when some rows have no TMDB ID, Trakt wants whole numbers
+        tmdb_id = int(row['TMDB ID']) if pd.notna(row['TMDB ID']) else None
         media_type = row['Type']
-        rank = index + 1  # Assign rank based on CSV order (starting from 1)
+        # lbList writes the Letterboxd rank, older CSVs only have the order of their rows
+        rank = int(row['Position']) if 'Position' in data.columns else index + 1
         letterboxd_url = row['Letterboxd URL']
-        letterboxd_urls[tmdb_id] = letterboxd_url
 
         items.append({
             'tmdb_id': tmdb_id,
             'type': media_type,
-            'rank': rank
+            'rank': rank,
+            'letterboxd_url': letterboxd_url
         })
     
-    return items, letterboxd_urls
+    return items
 
 # Main function to run the script with the new feature
 if __name__ == "__main__":
@@ -295,26 +252,21 @@ if __name__ == "__main__":
 
     # Process the CSV to get the list of items with their ranks and corresponding Letterboxd URLs
     csv_file_path = 'list.csv'  # Path to the uploaded CSV
-    items, letterboxd_urls = process_csv_with_rank(csv_file_path)
+    items = process_csv_with_rank(csv_file_path)
 
     if action == '1':
         # Create a new list on Trakt
         list_slug = create_trakt_list(access_token, client_id)
 
         # Add the items with their ranks to the Trakt list
-        add_status = add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id)
-
-        # If items were added, retrieve the list from Trakt and reorder the items based on the CSV
-        if add_status == 201:
-            print("Waiting 5 seconds for Trakt to update the list...")
-            time.sleep(5)  # Wait for a few seconds to allow Trakt to update the list
-            reorder_trakt_list(list_slug, items, access_token, client_id)
-            
-            # Retrieve the final list of items after reordering
+        added = add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id)
+
+        # If items were added, report what Trakt didn't find, then retrieve the list once and reorder the items based on the CSV
+        if added is not None:
+            report_not_added(items, added)
             trakt_items = retrieve_trakt_list(list_slug, access_token, client_id)
-            
-            # Compare the CSV items with the final Trakt list
-            compare_trakt_and_csv(items, trakt_items, letterboxd_urls)
+            if trakt_items:
+                reorder_trakt_list(list_slug, items, trakt_items, access_token, client_id)
     
     elif action == '2':
         # Ask the user for the Trakt list URL and extract the slug
@@ -325,18 +277,15 @@ if __name__ == "__main__":
         remove_all_items_from_trakt_list(list_slug, access_token, client_id)
 
         # Add the items with their ranks to the Trakt list
-        add_status = add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id)
+        added = add_items_to_trakt_list_with_rank(list_slug, items, access_token, client_id)
 
-        # If items were added, retrieve the list from Trakt and reorder the items based on the CSV
-        if add_status == 201:
-            print("Waiting 5 seconds for Trakt to update the list...")
-            time.sleep(5)  # Wait for a few seconds to allow Trakt to update the list
-            reorder_trakt_list(list_slug, items, access_token, client_id)
-
-            # Retrieve the final list of items after reordering
+        # If items were added, report what Trakt didn't find, then retrieve the list once and reorder the items based on the CSV
+        if added is not None:
+            report_not_added(items, added)
             trakt_items = retrieve_trakt_list(list_slug, access_token, client_id)
+            if trakt_items:
+                reorder_trakt_list(list_slug, items, trakt_items, access_token, client_id)
 
-            # Compare the CSV items with the final Trakt list
-            compare_trakt_and_csv(items, trakt_items, letterboxd_urls)
-
+    report_endpoints()
+    report_connections()
     print("All items have been processed and ordered correctly.")
\ No newline at end of file
@@ -1,14 +1,18 @@
 import pandas as pd
-import requests
 import json
 import os
-import time
+import sys
 import webbrowser
 import csv
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, TraktError, get_client, report_endpoints
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -53,7 +57,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -66,153 +70,53 @@ def authenticate_trakt():
         exit()
 
 # Function to retrieve the user's ratings for movies and shows from Trakt
-def get_trakt_ratings(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/ratings"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_ratings(access_token, client_id):
+    client = get_client(access_token, client_id)
 
     ratings = {'movies': {}, 'shows': {}}
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return ratings  # No more items to retrieve
-
-                # Separate ratings for movies and shows
-                for item in items:
-                    if 'movie' in item:
-                        movie = item['movie']
-                        tmdb_id = movie.get('ids', {}).get('tmdb', None)
-                        if tmdb_id:
-                            ratings['movies'][tmdb_id] = item.get('rating', None)
-                    elif 'show' in item:
-                        show = item['show']
-                        tmdb_id = show.get('ids', {}).get('tmdb', None)
-                        if tmdb_id:
-                            ratings['shows'][tmdb_id] = item.get('rating', None)
-
-                print(f"Retrieved page {page} of ratings...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve ratings. Response: {response.status_code} - {response.text}")
-                return ratings
+    try:
+        # Separate ratings for movies and shows
+        for item in client.paginate("/users/me/ratings", "ratings"):
+            if 'movie' in item:
+                movie = item['movie']
+                tmdb_id = movie.get('ids', {}).get('tmdb', None)
+                if tmdb_id:
+                    ratings['movies'][tmdb_id] = item.get('rating', None)
+            elif 'show' in item:
+                show = item['show']
+                tmdb_id = show.get('ids', {}).get('tmdb', None)
+                if tmdb_id:
+                    ratings['shows'][tmdb_id] = item.get('rating', None)
+    except TraktError as e:
+        print(f"Failed to retrieve ratings. Response: {e}")
 
     return ratings
 
 # Function to retrieve the user's entire movie history from Trakt
-def get_trakt_history_movies(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/history/movies"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_history_movies(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    history_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return history_items  # No more items to retrieve
-                history_items.extend(items)
-                print(f"Retrieved page {page} of movie history...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve history. Response: {response.status_code} - {response.text}")
-                return []
-
-    return history_items
+    try:
+        return list(client.paginate("/users/me/history/movies", "movie history"))
+    except TraktError as e:
+        print(f"Failed to retrieve history. Response: {e}")
+        return []
 
 # Function to retrieve the user's watched show progress from Trakt
-def get_trakt_show_progress(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/watched/shows"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
-
-    progress_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
+def get_trakt_show_progress(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-            if response.status_code == 200:
-                items = response.json()
-
-                # Get total page count from headers
-                total_pages = int(response.headers.get('X-Pagination-Page-Count', 1))
-
-                if not items:
-                    return progress_items  # No more items to retrieve
-                
-                progress_items.extend(items)
-                print(f"Retrieved page {page} of {total_pages} for show progress...")
-
-                # Stop if we reach the last page
-                if page >= total_pages:
-                    return progress_items
-
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve progress. Response: {response.status_code} - {response.text}")
-                return []
-
-    return progress_items
+    try:
+        return list(client.paginate("/users/me/watched/shows", "watched shows"))
+    except TraktError as e:
+        print(f"Failed to retrieve progress. Response: {e}")
+        return []
 
 # Function to retrieve the user's watchlist
 def get_watchlist(access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get("/sync/watchlist")
     if response.status_code == 200:
         return response.json()
     else:
@@ -378,3 +282,6 @@ if __name__ == "__main__":
 
     # Merge the CSVs and create a Letterboxd importable file
     merge_trakt_files('trakt_movies.csv', 'trakt_shows.csv', 'ImporttoLetterboxd.csv')
+
+    report_endpoints()
+    report_connections()
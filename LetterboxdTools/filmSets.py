@@ -0,0 +1,229 @@
+import os
+import time
+import zipfile
+import numpy as np
+from lbCache import CACHE_DIR, film_slug
+from lbExtract import LETTERBOXD_URL
+
+# Letterboxd star rating (0.5-5) from which a film counts as "rated highly"
+HIGH_RATING = 4.0
+
+# Films in common with the target before a friend's similarity counts in full (fewer shrink it towards 0)
+SIMILARITY_SHRINKAGE = 10
+
+# Layout version of the per-user index files, files from another version are crawled again
+INDEX_VERSION = 1
+
+# Seconds a user index is used without asking Letterboxd, after that the newest pages are checked
+INDEX_TTL = 24 * 60 * 60
+
+# Seconds after which an index is rebuilt with a full crawl (checking the newest pages only
+# finds films that were added or re-rated, not ones that were removed)
+INDEX_MAX_AGE = 7 * 24 * 60 * 60
+
+# Saved watched films and ratings of one Letterboxd user (a compressed .npz file in the cache folder),
+# so comparing the same people again doesn't crawl their whole profile
+class UserIndex:
+    def __init__(self, username, slugs=(), ratings=(), crawled_at=0.0, full_crawl_at=0.0, folder=None):
+        self.username = username
+        self.path = os.path.join(folder or os.path.join(CACHE_DIR, 'user_index'), f"{username.lower()}.npz")
+        self.slugs = np.asarray(slugs, dtype=str)
+        self.ratings = np.asarray(ratings, dtype=np.float32)
+        self.crawled_at = crawled_at
+        self.full_crawl_at = full_crawl_at
+
+    # Function to load the saved index, nothing is loaded when it's missing, unreadable or from another version
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data['version']) != INDEX_VERSION:
+                    return False
+                self.slugs = data['slugs']
+                self.ratings = data['ratings']
+                self.crawled_at = float(data['crawled_at'])
+                self.full_crawl_at = float(data['full_crawl_at'])
+            return True
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return False
+
+    # Function to check whether the index can be used without asking Letterboxd
+    def is_fresh(self, ttl=INDEX_TTL):
+        return time.time() - self.crawled_at < ttl
+
+    # Function to check whether checking the newest pages is enough to bring the index up to date
+    def can_refresh(self, max_age=INDEX_MAX_AGE):
+        return time.time() - self.full_crawl_at < max_age
+
+    # Function to get {film slug: star rating or None}
+    def movies(self):
+        return {slug: None if np.isnan(rating) else float(rating) for slug, rating in zip(self.slugs.tolist(), self.ratings)}
+
+    # Function to replace the index with a full crawl, or merge the films found on the newest pages into it
+    def update(self, movies, full):
+        if not full:
+            movies = {**self.movies(), **movies}
+        self.slugs = np.array(list(movies), dtype=str)
+        self.ratings = np.array([np.nan if rating is None else rating for rating in movies.values()], dtype=np.float32)
+        self.crawled_at = time.time()
+        if full:
+            self.full_crawl_at = self.crawled_at
+
+    # Function to write the index (to a temporary file first, so a crash never leaves half a file behind)
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = self.path + '.tmp.npz'
+        np.savez_compressed(temp_path, version=INDEX_VERSION, slugs=self.slugs, ratings=self.ratings,
+                            crawled_at=self.crawled_at, full_crawl_at=self.full_crawl_at)
+        os.replace(temp_path, self.path)
+
+# Watched films and ratings of any number of Letterboxd users, for set queries across all of them.
+# Film slugs are interned to integer IDs, so every user is a row of a users x films matrix: a bool
+# matrix of what they watched and a float32 matrix of their ratings (NaN where they didn't rate)
+class FilmSets:
+    def __init__(self):
+        self.slugs = []
+        self.film_ids = {}
+        self.users = {}
+        self.user_films = []
+        self.watched = None
+        self.ratings = None
+
+    # Function to turn a film slug into its integer ID, adding it the first time it is seen
+    def intern(self, slug):
+        film_id = self.film_ids.get(slug)
+        if film_id is None:
+            film_id = self.film_ids[slug] = len(self.slugs)
+            self.slugs.append(slug)
+        return film_id
+
+    # Function to add a user from {movie URL: star rating or None}
+    def add_user(self, name, movies):
+        ratings = np.array([np.nan if rating is None else rating for rating in movies.values()], dtype=np.float32)
+        self.add_user_slugs(name, [film_slug(movie_url) for movie_url in movies], ratings)
+
+    # Function to add a user from a list of film slugs and an array of their ratings (e.g. a UserIndex)
+    def add_user_slugs(self, name, slugs, ratings):
+        film_ids = np.fromiter((self.intern(slug) for slug in slugs), dtype=np.int32, count=len(slugs))
+        self.add_user_arrays(name, film_ids, np.asarray(ratings, dtype=np.float32))
+
+    # Function to add a user from parallel arrays of film IDs and ratings
+    def add_user_arrays(self, name, film_ids, ratings):
+        self.users[name] = len(self.user_films)
+        self.user_films.append((film_ids, ratings))
+        self.watched = self.ratings = None
+
+    # Function to build the users x films matrices (once, after the last user was added)
+    def build(self):
+        if self.watched is None:
+            self.watched = np.zeros((len(self.user_films), len(self.slugs)), dtype=bool)
+            self.ratings = np.full((len(self.user_films), len(self.slugs)), np.nan, dtype=np.float32)
+            for row, (film_ids, ratings) in enumerate(self.user_films):
+                self.watched[row, film_ids] = True
+                self.ratings[row, film_ids] = ratings
+        return self.watched, self.ratings
+
+    # Function to get the matrix rows of some users
+    def rows(self, names):
+        return [self.users[name] for name in names]
+
+    # Function to count, for every film, how many of the users watched it
+    def watch_counts(self, names):
+        watched, ratings = self.build()
+        return watched[self.rows(names)].sum(axis=0)
+
+    # Set queries, each returns a bool mask over the films
+    def seen_by_any(self, names):
+        return self.watch_counts(names) > 0
+
+    def seen_by_all(self, names):
+        return self.watch_counts(names) == len(names)
+
+    def seen_by_at_least(self, names, k):
+        return self.watch_counts(names) >= k
+
+    # Function to count, for every film, how many of the users rated it at least min_rating
+    def rated_at_least(self, names, min_rating=HIGH_RATING):
+        watched, ratings = self.build()
+        with np.errstate(invalid='ignore'):
+            return (ratings[self.rows(names)] >= min_rating).sum(axis=0)
+
+    # Function to average the ratings of the users for every film (NaN when none of them rated it)
+    def mean_ratings(self, names):
+        watched, ratings = self.build()
+        user_ratings = ratings[self.rows(names)]
+        rated = ~np.isnan(user_ratings)
+        totals = np.where(rated, user_ratings, 0).sum(axis=0)
+        counts = rated.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, totals / counts, np.nan)
+
+    # Function to find the films watched by at least min_watchers of the watchers and by none of the
+    # others, ranked by how many watchers rated them highly, then by their average rating.
+    # Returns (movie URL, watched by, rated highly by, average rating) tuples
+    def unseen_by(self, others, watchers, min_watchers=1, high_rating=HIGH_RATING):
+        candidates = np.flatnonzero(self.seen_by_at_least(watchers, min_watchers) & ~self.seen_by_any(others))
+        watch_counts = self.watch_counts(watchers)[candidates]
+        high_counts = self.rated_at_least(watchers, high_rating)[candidates]
+        mean_ratings = self.mean_ratings(watchers)[candidates]
+
+        # np.lexsort sorts by the last key first, unrated films go after the rated ones
+        order = np.lexsort((-watch_counts, -np.nan_to_num(mean_ratings, nan=-1.0), -high_counts))
+        return [
+            (f"{LETTERBOXD_URL}/film/{self.slugs[candidates[i]]}/", int(watch_counts[i]), int(high_counts[i]),
+             None if np.isnan(mean_ratings[i]) else round(float(mean_ratings[i]), 2))
+            for i in order
+        ]
+
+    # Function to score the films the target hasn't watched from the ratings of their friends, as sparse
+    # users x films matrices (needs scipy). Ratings are centred on each user's average, friends are weighted
+    # by the cosine similarity of their centred ratings with the target's (shrunk when they share few films,
+    # friends with opposite tastes don't count), and a film scores the target's average plus the weighted
+    # average deviation of the friends who rated it. Returns (movie URL, score, rated by) tuples, best first
+    def recommend(self, target, friends, min_raters=1, shrinkage=SIMILARITY_SHRINKAGE):
+        # Only imported when asked for, so the set comparisons work without scipy installed
+        from scipy import sparse
+
+        rows, film_ids, centred_ratings, averages = [], [], [], []
+        for row, name in enumerate([target] + friends):
+            user_film_ids, user_ratings = self.user_films[self.users[name]]
+            rated = ~np.isnan(user_ratings)
+            averages.append(user_ratings[rated].mean() if rated.any() else np.nan)
+            rows.append(np.full(rated.sum(), row, dtype=np.int32))
+            film_ids.append(user_film_ids[rated])
+            centred_ratings.append(user_ratings[rated] - averages[-1])
+
+        shape = (1 + len(friends), len(self.slugs))
+        rows = np.concatenate(rows)
+        film_ids = np.concatenate(film_ids)
+        centred = sparse.csr_matrix((np.concatenate(centred_ratings), (rows, film_ids)), shape=shape, dtype=np.float32)
+        rated = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, film_ids)), shape=shape)
+
+        # Similarity of every friend to the target, over the films they both rated
+        dot_products = (centred[1:] @ centred[0].T).toarray().ravel()
+        norms = np.sqrt(np.asarray(centred.multiply(centred).sum(axis=1)).ravel())
+        in_common = (rated[1:] @ rated[0].T).toarray().ravel()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            similarity = np.where(norms[1:] * norms[0] > 0, dot_products / (norms[1:] * norms[0]), 0.0)
+        weights = np.clip(similarity, 0, None) * in_common / (in_common + shrinkage)
+
+        # Without any overlap in taste to go on, every friend counts the same
+        if not weights.any():
+            weights = np.ones(len(friends))
+
+        weighted_deviations = centred[1:].T @ weights
+        weight_totals = rated[1:].T @ weights
+        raters = np.asarray(rated[1:].sum(axis=0)).ravel()
+
+        unseen = np.ones(len(self.slugs), dtype=bool)
+        unseen[self.user_films[self.users[target]][0]] = False
+        candidates = np.flatnonzero(unseen & (raters >= min_raters) & (weight_totals > 0))
+
+        # A target without ratings gets scores around the friends' overall average instead
+        target_average = averages[0] if not np.isnan(averages[0]) else np.nanmean(averages[1:])
+        scores = np.clip(target_average + weighted_deviations[candidates] / weight_totals[candidates], 0.5, 5)
+
+        order = np.lexsort((-raters[candidates], -scores))
+        return [
+            (f"{LETTERBOXD_URL}/film/{self.slugs[candidates[i]]}/", round(float(scores[i]), 2), int(raters[candidates[i]]))
+            for i in order
+        ]
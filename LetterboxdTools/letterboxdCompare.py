@@ -1,136 +1,220 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import sys
+
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+import lbExtract
+from crawlEngine import CrawlEngine, FETCH_ERRORS
+from httpCache import HttpCache
+from lbCache import film_slug
+from lbPaginator import open_all, page_url
+from filmSets import FilmSets, UserIndex
+from httpSession import report_connections
 
 # Define the header for the output CSV
 csv_file = "recommendations.csv"
 
-# Function to extract movie URLs and ratings from the ratings page
-def extract_ratings(page_url):
-    response = requests.get(page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    ratings_data = {}
-    
-    movie_items = soup.find_all('li', class_='poster-container')
-    
-    for li in movie_items:
-        lazy_load_div = li.find('div', class_='really-lazy-load')
-        if lazy_load_div and lazy_load_div.get('data-target-link'):
-            movie_url = "https://letterboxd.com" + lazy_load_div['data-target-link']
-            rating_tag = li.find('span', class_='rating')
-            if rating_tag:
-                rating_class = next((cls for cls in rating_tag['class'] if 'rated-' in cls), None)
-                if rating_class:
-                    letterboxd_rating = float(rating_class.replace('rated-', '')) / 2
-                    ratings_data[movie_url] = letterboxd_rating
-    return ratings_data
-
-# Function to extract watched movies (without ratings)
-def extract_movie_urls(page_url):
-    response = requests.get(page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    movie_urls = []
-    movie_items = soup.find_all('li', class_='poster-container')
-    
-    for li in movie_items:
-        lazy_load_div = li.find('div', class_='really-lazy-load')
-        if lazy_load_div and lazy_load_div.get('data-target-link'):
-            movie_url = "https://letterboxd.com" + lazy_load_div['data-target-link']
-            movie_urls.append(movie_url)
-    
-    return movie_urls
-
-# Function to get the last page number of the user's watched movies list
-def get_last_page(base_url):
-    first_page_url = base_url + "/page/1/"
-    response = requests.get(first_page_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    pagination = soup.find('div', class_='paginate-pages')
-    if pagination:
-        last_page_link = pagination.find_all('a')[-1].get('href')
-        last_page_number = int(last_page_link.split('/page/')[-1].strip('/'))
-    else:
-        last_page_number = 1
-
-    return last_page_number
-
-# Function to crawl multiple pages using ThreadPoolExecutor for concurrent execution
-def crawl_movies_concurrent(user_url, scrape_ratings=False):
-    last_page = get_last_page(user_url)
-    all_movies = {}
-
-    # Use ThreadPoolExecutor for concurrent page crawling
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = []
-        for page in range(1, last_page + 1):
-            page_url = f"{user_url}/page/{page}/"
-            if scrape_ratings:
-                futures.append(executor.submit(extract_ratings, page_url))
-            else:
-                futures.append(executor.submit(extract_movie_urls, page_url))
-        
-        # Collect results as they complete
-        for future in as_completed(futures):
-            if scrape_ratings:
-                all_movies.update(future.result())
+# Maximum number of Letterboxd requests in flight at once
+max_concurrency = 100
+
+# Worker processes for HTML parsing (0 = parse in the main process), see Common/parseBenchmark.py
+parse_processes = lbExtract.default_parse_processes()
+
+# Shared asyncio crawl engine used for every Letterboxd request (listing pages are revalidated
+# against the on-disk HTTP cache instead of being downloaded again)
+engine = CrawlEngine(concurrency=max_concurrency, http_cache=HttpCache(), parse_processes=parse_processes)
+
+# Function to extract [movie URL, rating] entries from a films page (page.data is filled by lbExtract.extract_poster_entries)
+def extract_poster_entries(page):
+    return page.data
+
+# Function to build the URL of a user's films pages
+def films_url(username):
+    return f"{lbExtract.LETTERBOXD_URL}/{username}/films/"
+
+# Function to crawl the films pages of every user at once, returns {username: {movie URL: rating or None}}
+# and the set of users with pages that failed (their films are incomplete). Each user's page 1 gives
+# their page count, then the remaining pages of all users go out as one batch
+def crawl_users(usernames):
+    user_urls = [films_url(username) for username in usernames]
+    page_urls = []
+    owners = []
+    failed_users = set()
+    for username, paginator in zip(usernames, open_all(engine, user_urls)):
+        try:
+            if not paginator.open().ok:
+                print(f"Couldn't load the films of {username} (HTTP {paginator.first_page.status})")
+                failed_users.add(username)
+                continue
+            user_page_urls = paginator.page_urls()
+        except FETCH_ERRORS as e:
+            print(f"Couldn't load the films of {username} ({e!r})")
+            failed_users.add(username)
+            continue
+        if not paginator.complete:
+            failed_users.add(username)
+            continue
+        page_urls.extend(user_page_urls)
+        owners.extend([username] * len(user_page_urls))
+
+    all_movies = {username: {} for username in usernames}
+    for username, entries in zip(owners, engine.map(page_urls, extract_poster_entries, cached=True, extract=lbExtract.extract_poster_entries)):
+        if entries is None:
+            failed_users.add(username)
+        else:
+            all_movies[username].update((movie_url, rating) for movie_url, rating in entries)
+    return all_movies, failed_users
+
+# Function to check the newest films pages of users whose index is stale. Films pages list the latest
+# films first, so each user is walked until a page brings nothing new (page 1 of every user goes out
+# at once). Returns {username: {slug: rating}} of the new or re-rated films, None for a user whose pages failed
+def crawl_new_films(indexes):
+    new_films = {}
+    for index, paginator in zip(indexes, open_all(engine, [films_url(index.username) for index in indexes])):
+        known_films = index.movies()
+        changes = {}
+        page_number = 1
+        while True:
+            try:
+                page = paginator.open() if page_number == 1 else engine.get(page_url(paginator.base_url, page_number), cached=True)
+            except FETCH_ERRORS as e:
+                print(f"Error fetching page {page_number} of {index.username}: {e!r}")
+                changes = None
+                break
+            if not page.ok:
+                changes = None
+                break
+            page_changes = {}
+            for movie_url, rating in lbExtract.extract_poster_entries(page.body):
+                slug = film_slug(movie_url)
+                if slug not in known_films or known_films[slug] != rating:
+                    page_changes[slug] = rating
+            changes.update(page_changes)
+            if not page_changes:
+                break
+            if page_number >= paginator.count_pages():
+                # Pages past a failed probe are unknown, so a full crawl has to find the rest
+                if not paginator.complete:
+                    changes = None
+                break
+            page_number += 1
+        new_films[index.username] = changes
+    return new_films
+
+# Function to get the watched films and ratings of every user as UserIndex objects: fresh indexes are
+# used as they are, stale ones only get their newest pages checked, and users without a (recent enough)
+# index are crawled in full. Complete crawls are saved for the next comparison. When a user's pages
+# failed the comparison would be wrong, so the script stops instead
+def load_users(usernames):
+    indexes = {username: UserIndex(username) for username in usernames}
+    to_refresh = []
+    to_crawl = []
+    for username, index in indexes.items():
+        if not index.load() or not index.can_refresh():
+            to_crawl.append(username)
+        elif index.is_fresh():
+            print(f"- Using the saved films of {username} ({len(index.slugs)} films)")
+        else:
+            to_refresh.append(index)
+
+    if to_refresh:
+        print(f"- Checking new films for {', '.join(index.username for index in to_refresh)}")
+        for username, changes in crawl_new_films(to_refresh).items():
+            if changes is None:
+                to_crawl.append(username)
             else:
-                movie_urls = future.result()
-                all_movies.update({url: None for url in movie_urls})
-    
-    return all_movies
-
-# Function to extract the username from the original Letterboxd URL
+                indexes[username].update(changes, full=False)
+                indexes[username].save()
+
+    if to_crawl:
+        print(f"- Crawling watched movies for {', '.join(to_crawl)}")
+        all_movies, failed_users = crawl_users(to_crawl)
+        for username, movies in all_movies.items():
+            if username not in failed_users:
+                indexes[username].update({film_slug(movie_url): rating for movie_url, rating in movies.items()}, full=True)
+                indexes[username].save()
+
+        if failed_users:
+            print(f"Some films pages of {', '.join(sorted(failed_users))} couldn't be loaded. Please try again later.")
+            engine.close()
+            engine.report()
+            exit()
+
+    return indexes
+
+# Function to extract the username from a Letterboxd profile URL (or take a plain username as is)
 def extract_username(url):
-    return url.split("/")[-2]  # This will correctly extract the username from the original URL
+    return url.rstrip("/").split("/")[-1]
+
+# Function to read a comma separated list of profile URLs/usernames
+def read_usernames(prompt):
+    return [extract_username(url) for url in input(prompt).split(",") if url.strip()]
 
-# Function to compare watched movies between User 1 and User 2
-def compare_users(user1_movies, user2_movies):
-    recommendations = {url: rating for url, rating in user1_movies.items() if url not in user2_movies}
-    return sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+# Function to find the films the watchers have seen and none of the others have, ranked by how many
+# watchers rated them highly. Returns the CSV columns and rows (one watcher keeps its ratings column)
+def compare_users(film_sets, watchers, others, min_watchers=1):
+    recommendations = film_sets.unseen_by(others, watchers, min_watchers)
+    if len(watchers) == 1:
+        return [f"{watchers[0]} ratings"], [(movie_url, rating) for movie_url, watched_by, rated_highly_by, rating in recommendations]
+    return ["Watched by", "Rated highly by", "Average rating"], recommendations
+
+# Function to recommend films to the target from what their friends rated, friends with similar
+# taste weigh more. Returns the CSV columns and rows
+def recommend_films(film_sets, target, friends, min_raters=1):
+    return ["Score", "Rated by"], film_sets.recommend(target, friends, min_raters)
 
 # Function to save the recommendations to a CSV file
-def save_to_csv(recommendations, user1_name):
-    csv_header = ["Letterboxd URL", f"{user1_name} ratings"]
+def save_to_csv(recommendations, columns):
+    csv_header = ["Letterboxd URL"] + columns
     
     with open(csv_file, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(csv_header)
-        for movie_url, rating in recommendations:
-            writer.writerow([movie_url, rating])
+        writer.writerows(recommendations)
 
     print(f"Recommendations saved to {csv_file}")
 
 # Main function to execute the comparison
 def main():
-    print("Example input for Letterboxd URL: https://letterboxd.com/nigeljordanw/")
-    user1_url_input = input("Enter Letterboxd URL for User that has watched: ").strip()
-    user2_url_input = input("Enter Letterboxd URL for User that hasn't watched: ").strip()
-    
-    # Extract usernames from original URLs
-    user1_name = extract_username(user1_url_input)
-    user2_name = extract_username(user2_url_input)
-    
-    # Modify the URLs for scraping
-    user1_url = user1_url_input + "films/by/entry-rating/"
-    user2_url = user2_url_input + "films/"
-    
-    # Crawl watched movies with ratings for User 1
-    print(f"Crawling watched movies for {user1_name} from {user1_url}")
-    user1_movies = crawl_movies_concurrent(user1_url, scrape_ratings=True)
+    print("Example input for Letterboxd URL: https://letterboxd.com/nigeljordanw/ (separate several users with commas)")
+
+    # Ask if the user wants friends consensus recommendations instead of a plain comparison
+    recommend = input("Do you want recommendations for one user based on their friends' ratings? Needs scipy (yes/no): ").strip().lower() == "yes"
 
-    # Crawl watched movies without ratings for User 2
-    print(f"Crawling watched movies for {user2_name} from {user2_url}")
-    user2_movies = crawl_movies_concurrent(user2_url, scrape_ratings=False)
+    min_watchers = 1
+    if recommend:
+        watchers = read_usernames("Enter Letterboxd URLs for the friends (separate with commas): ")
+        others = read_usernames("Enter Letterboxd URL for the user to recommend films to: ")[:1]
+        answer = input("How many friends must have rated a film? (default 1): ").strip()
+        min_watchers = int(answer) if answer else 1
+    else:
+        watchers = read_usernames("Enter Letterboxd URL(s) for the users that have watched: ")
+        others = read_usernames("Enter Letterboxd URL(s) for the users that haven't watched: ")
+
+        # With several watchers, a film can be required to have been seen by a number of them
+        if len(watchers) > 1:
+            answer = input(f"How many of the {len(watchers)} watchers must have seen a film? (1-{len(watchers)}, default 1): ").strip()
+            min_watchers = int(answer) if answer else 1
+
+    # Load the watched movies and ratings of every user (from their saved index when it's recent),
+    # the users that need crawling are crawled concurrently
+    film_sets = FilmSets()
+    for username, index in load_users(watchers + others).items():
+        film_sets.add_user_slugs(username, index.slugs.tolist(), index.ratings)
 
     # Compare watched movies and get recommendations
-    recommendations = compare_users(user1_movies, user2_movies)
+    if recommend:
+        columns, recommendations = recommend_films(film_sets, others[0], watchers, min_watchers)
+    else:
+        columns, recommendations = compare_users(film_sets, watchers, others, min_watchers)
 
     # Save recommendations to CSV
-    save_to_csv(recommendations, user1_name)
+    save_to_csv(recommendations, columns)
+
+    engine.close()
+    engine.report()
+    report_connections()
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,16 @@
-import requests
 import json
 import os
-import time
+import sys
 import webbrowser
 import csv
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, TraktError, get_client, report_endpoints
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -51,7 +55,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -64,66 +68,32 @@ def authenticate_trakt():
         exit()
 
 # Function to retrieve the user's ratings for movies and shows from Trakt
-def get_trakt_ratings(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/ratings"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_ratings(access_token, client_id):
+    client = get_client(access_token, client_id)
 
     ratings = {'movies': {}, 'shows': {}}
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return ratings  # No more items to retrieve
-
-                # Separate ratings for movies and shows
-                for item in items:
-                    if 'movie' in item:
-                        movie = item['movie']
-                        tmdb_id = movie.get('ids', {}).get('tmdb', None)
-                        if tmdb_id:
-                            ratings['movies'][tmdb_id] = item.get('rating', None)
-                    elif 'show' in item:
-                        show = item['show']
-                        tmdb_id = show.get('ids', {}).get('tmdb', None)
-                        if tmdb_id:
-                            ratings['shows'][tmdb_id] = item.get('rating', None)
-
-                print(f"Retrieved page {page} of ratings...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve ratings. Response: {response.status_code} - {response.text}")
-                return ratings
+    try:
+        # Separate ratings for movies and shows
+        for item in client.paginate("/users/me/ratings", "ratings"):
+            if 'movie' in item:
+                movie = item['movie']
+                tmdb_id = movie.get('ids', {}).get('tmdb', None)
+                if tmdb_id:
+                    ratings['movies'][tmdb_id] = item.get('rating', None)
+            elif 'show' in item:
+                show = item['show']
+                tmdb_id = show.get('ids', {}).get('tmdb', None)
+                if tmdb_id:
+                    ratings['shows'][tmdb_id] = item.get('rating', None)
+    except TraktError as e:
+        print(f"Failed to retrieve ratings. Response: {e}")
 
     return ratings
 
 # Function to retrieve detailed show information from Trakt
 def get_show_details(trakt_slug, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/shows/{trakt_slug}/seasons?extended=episodes"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
-    response = requests.get(trakt_url, headers=headers)
+    client = get_client(access_token, client_id)
+    response = client.get(f"/shows/{trakt_slug}/seasons?extended=episodes")
     if response.status_code == 200:
         return response.json()  # Return detailed season/episode data
     else:
@@ -133,15 +103,9 @@ def get_show_details(trakt_slug, access_token, client_id):
 
 # Function to retrieve the user's watchlist
 def get_watchlist(access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get("/sync/watchlist")
     if response.status_code == 200:
         return response.json()
     else:
@@ -150,15 +114,9 @@ def get_watchlist(access_token, client_id):
 
 # Function to retrieve a user's personal lists
 def get_user_lists(access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get("/users/me/lists")
     if response.status_code == 200:
         return response.json()
     else:
@@ -167,15 +125,9 @@ def get_user_lists(access_token, client_id):
 
 # Function to retrieve items from a personal list
 def get_list_items(list_slug, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get(f"/users/me/lists/{list_slug}/items")
     if response.status_code == 200:
         return response.json()
     else:
@@ -234,80 +186,24 @@ def create_list_csv(list_items, list_name):
 
 
 # Function to retrieve the user's entire movie history from Trakt
-def get_trakt_history_movies(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/history/movies"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_history_movies(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    history_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return history_items  # No more items to retrieve
-                history_items.extend(items)
-                print(f"Retrieved page {page} of movie history...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve history. Response: {response.status_code} - {response.text}")
-                return []
-
-    return history_items
+    try:
+        return list(client.paginate("/users/me/history/movies", "movie history"))
+    except TraktError as e:
+        print(f"Failed to retrieve history. Response: {e}")
+        return []
 
 # Function to retrieve the user's watched episodes history from Trakt
-def get_trakt_history_shows(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/history/shows"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_history_shows(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    history_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return history_items  # No more items to retrieve
-                history_items.extend(items)
-                print(f"Retrieved page {page} of watched episodes history...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve watched episodes. Response: {response.status_code} - {response.text}")
-                return []
-
-    return history_items
+    try:
+        return list(client.paginate("/users/me/history/shows", "watched episodes"))
+    except TraktError as e:
+        print(f"Failed to retrieve watched episodes. Response: {e}")
+        return []
 
 
 # Function to create CSV for watched episodes history, including TMDB and TVDB IDs
@@ -420,4 +316,6 @@ if __name__ == "__main__":
             list_items = get_list_items(list_slug, access_token, client_id)
             create_list_csv(list_items, list_name)
 
+    report_endpoints()
+    report_connections()
     print("Backup process completed successfully.")
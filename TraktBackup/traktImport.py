@@ -1,15 +1,20 @@
-import requests
 import pandas as pd
 import json
 from datetime import datetime
 import os
+import sys
 import webbrowser
 import re
-import time
 import csv
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, get_client, report_endpoints
+from traktSync import sync_items
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -54,7 +59,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -66,24 +71,9 @@ def authenticate_trakt():
         print(f"Error authenticating with Trakt: {response.status_code} - {response.text}")
         exit()
 
-# Function to retry requests on rate limit (429)
-def handle_rate_limit(response):
-    if response.status_code == 429:
-        retry_after = int(response.headers.get('Retry-After', 1))
-        print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying...")
-        time.sleep(retry_after)
-        return True
-    return False
-
-# Function to mark episodes as watched with batch processing and specific IDs
-def mark_episodes_watched(episodes, access_token, client_id, retries=5):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to mark episodes as watched with specific IDs, sent in chunks
+def mark_episodes_watched(episodes, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     # Create a batch payload for all episodes
     payload = {
@@ -103,21 +93,7 @@ def mark_episodes_watched(episodes, access_token, client_id, retries=5):
             "watched_at": watched_at
         })
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 201:
-            print(f"Successfully marked episodes as watched.")
-            return
-        elif handle_rate_limit(response):
-            continue
-        else:
-            print(f"Failed to mark episodes as watched. Response: {response.status_code} - {response.text}")
-            break
-
-    if attempt == retries:
-        print(f"Failed after {retries} attempts due to rate limits.")
+    sync_items(client, "/sync/history", payload).report("Episodes marked as watched")
 
 
 
@@ -139,36 +115,16 @@ def process_shows_csv(file_path, watched_at):
 
 
 
-# Function to mark movies as watched with retry mechanism
-def mark_movies_watched(movies, access_token, client_id, retries=5):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to mark movies as watched, sent in chunks
+def mark_movies_watched(movies, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     # Create payload for each movie with its watched date
     payload = {
         "movies": [{"ids": {"tmdb": movie_id}, "watched_at": watched_at} for movie_id, watched_at in movies]
     }
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-        
-        if response.status_code == 201:
-            print("Successfully marked movies as watched.")
-            return
-        elif handle_rate_limit(response):
-            continue
-        else:
-            print(f"Failed to mark movies as watched. Response: {response.status_code} - {response.text}")
-            break
-
-    if attempt == retries:
-        print(f"Failed after {retries} attempts due to rate limits.")
+    sync_items(client, "/sync/history", payload).report("Movies marked as watched")
 
 
 # Function to process the movies CSV file and return a list of movies with watched date
@@ -181,15 +137,9 @@ def process_movies_csv(file_path, watched_at):
         return [(row['TMDB ID'], watched_at) for _, row in data.iterrows()]  # Use the provided watched date (now or release date)
 
 
-# Function to sync ratings to Trakt with retries
-def import_ratings(movies, shows, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/ratings"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+# Function to sync ratings to Trakt
+def import_ratings(movies, shows, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     payload = {
         "movies": [{"ids": {"tmdb": movie_id}, "rating": rating} for movie_id, rating in movies.items() if rating != ''],
@@ -200,31 +150,16 @@ def import_ratings(movies, shows, access_token, client_id, retries=3):
         print("No ratings to import.")
         return
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-        
-        if response.status_code == 201:
-            print("Successfully imported ratings.")
-            return
-        elif handle_rate_limit(response):
-            continue
-        else:
-            print(f"Failed to import ratings. Response: {response.status_code} - {response.text}")
-            break
-
-    if attempt == retries:
-        print(f"Failed after {retries} attempts due to rate limits.")
-
-# Function to create a personal list on Trakt with retry mechanism for rate limits
-def create_personal_list(list_name, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    response = client.post("/sync/ratings", payload)
+    
+    if response.status_code == 201:
+        print("Successfully imported ratings.")
+    else:
+        print(f"Failed to import ratings. Response: {response.status_code} - {response.text}")
+
+# Function to create a personal list on Trakt
+def create_personal_list(list_name, access_token, client_id):
+    client = get_client(access_token, client_id)
     payload = {
         "name": list_name,
         "privacy": "private",  # Modify the privacy setting if needed
@@ -232,54 +167,30 @@ def create_personal_list(list_name, access_token, client_id, retries=3):
         "allow_comments": True
     }
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-        if response.status_code == 201:
-            print(f"Created list: {list_name}")
-            return response.json()['ids']['slug']  # Return the slug for the newly created list
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to create list {list_name}. Response: {response.status_code} - {response.text}")
-            return None
-    print(f"Failed to create list {list_name} after {retries} attempts.")
-    return None
-
-# Function to add items to a personal list with retry mechanism for rate limits
-def add_items_to_list(list_slug, items, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_slug}/items"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    response = client.post("/users/me/lists", payload)
+    if response.status_code == 201:
+        print(f"Created list: {list_name}")
+        return response.json()['ids']['slug']  # Return the slug for the newly created list
+    else:
+        print(f"Failed to create list {list_name}. Response: {response.status_code} - {response.text}")
+        return None
+
+# Function to add items to a personal list
+def add_items_to_list(list_slug, items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     payload = {
         "movies": [{"ids": {"tmdb": item['TMDB ID']}} for item in items if item['Type'] == 'movie'],
         "shows": [{"ids": {"tmdb": item['TMDB ID']}} for item in items if item['Type'] == 'show']
     }
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-        if response.status_code == 201:
-            print(f"Successfully added items to list {list_slug}.")
-            return True
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to add items to list {list_slug}. Response: {response.status_code} - {response.text}")
-            return False
-    print(f"Failed to add items to list {list_slug} after {retries} attempts.")
-    return False
+    response = client.post(f"/users/me/lists/{list_slug}/items", payload)
+    if response.status_code == 201:
+        print(f"Successfully added items to list {list_slug}.")
+        return True
+    else:
+        print(f"Failed to add items to list {list_slug}. Response: {response.status_code} - {response.text}")
+        return False
 
 
 # Function to process and import lists from the 'lists' directory
@@ -315,20 +226,14 @@ def import_watchlist(access_token, client_id):
         for row in reader:
             items.append(row)
 
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
     payload = {
         "movies": [{"ids": {"tmdb": item['TMDB ID']}} for item in items if item['Type'] == 'movie'],
         "shows": [{"ids": {"tmdb": item['TMDB ID']}} for item in items if item['Type'] == 'show']
     }
 
-    response = requests.post(trakt_url, headers=headers, json=payload)
+    response = client.post("/sync/watchlist", payload)
     if response.status_code == 201:
         print(f"Successfully imported {len(items)} items to the watchlist.")
     else:
@@ -336,16 +241,10 @@ def import_watchlist(access_token, client_id):
 
 # Function to import watched history (already existing, just ensure it's called when needed)
 def import_watched_history(access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
     # Example of fetching watched history (for illustration)
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get("/sync/history")
     if response.status_code == 200:
         history = response.json()
         print(f"Successfully imported watched history with {len(history)} items.")
@@ -431,4 +330,6 @@ if __name__ == "__main__":
     if import_lists_choice == 'yes':
         import_lists(access_token, client_id)
 
+    report_endpoints()
+    report_connections()
     print("All movies, shows, ratings, watched history, and lists have been processed.")
@@ -1,11 +1,15 @@
-import requests
 import json
 import os
-import time
+import sys
 import webbrowser
 
-# Trakt API URL for authorization and syncing
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, TraktError, get_client, report_endpoints
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -53,7 +57,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -66,52 +70,18 @@ def authenticate_trakt():
         exit()
 
 # Function to retrieve all ratings (movies, shows, and episodes)
-def get_trakt_ratings(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/ratings"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_ratings(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    ratings_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return ratings_items  # No more items to retrieve
-                ratings_items.extend(items)
-                print(f"Retrieved page {page} of ratings...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve ratings. Response: {response.status_code} - {response.text}")
-                return []
-
-    return ratings_items
+    try:
+        return list(client.paginate("/users/me/ratings", "ratings"))
+    except TraktError as e:
+        print(f"Failed to retrieve ratings. Response: {e}")
+        return []
 
 # Function to delete ratings from Trakt
-def delete_trakt_ratings(ratings_items, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/ratings/remove"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def delete_trakt_ratings(ratings_items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     # Organize ratings by type for deletion
     movies = [{"ids": item['movie']['ids']} for item in ratings_items if item['type'] == 'movie']
@@ -130,71 +100,26 @@ def delete_trakt_ratings(ratings_items, access_token, client_id, retries=3):
 
     print(f"Deleting {len(movies)} movie ratings, {len(shows)} show ratings, and {len(episodes)} episode ratings...")
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            print("Successfully deleted all ratings.")
-            return
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to delete ratings. Response: {response.status_code} - {response.text}")
-            return
+    response = client.post("/sync/ratings/remove", payload)
 
-    print(f"Failed to delete ratings after {retries} attempts due to rate limits.")
+    if response.status_code == 200:
+        print("Successfully deleted all ratings.")
+    else:
+        print(f"Failed to delete ratings. Response: {response.status_code} - {response.text}")
 
 # Function to retrieve the user's entire history from Trakt
-def get_trakt_history(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_history(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    history_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return history_items  # No more items to retrieve
-                history_items.extend(items)
-                print(f"Retrieved page {page} of history...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve history. Response: {response.status_code} - {response.text}")
-                return []
-
-    return history_items
+    try:
+        return list(client.paginate("/users/me/history", "history items"))
+    except TraktError as e:
+        print(f"Failed to retrieve history. Response: {e}")
+        return []
 
 # Function to delete items from Trakt history
-def delete_trakt_history(history_items, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history/remove"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def delete_trakt_history(history_items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     history_ids = [item['id'] for item in history_items]
 
@@ -208,76 +133,27 @@ def delete_trakt_history(history_items, access_token, client_id, retries=3):
 
     print(f"Deleting {len(history_ids)} history items...")
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            print("Successfully deleted all history items.")
-            return
-        elif response.status_code == 504:
-            print(f"Gateway timeout (504). Retrying... (Attempt {attempt+1}/{retries})")
-            attempt += 1
-            time.sleep(5)  # Wait before retrying
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to delete history. Response: {response.status_code} - {response.text}")
-            return
+    response = client.post("/sync/history/remove", payload)
 
-    print(f"Failed to delete history after {retries} attempts due to errors.")
+    if response.status_code == 200:
+        print("Successfully deleted all history items.")
+    else:
+        print(f"Failed to delete history. Response: {response.status_code} - {response.text}")
 
 
 # Function to retrieve the watchlist from Trakt
-def get_trakt_watchlist(access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def get_trakt_watchlist(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-    watchlist_items = []
-    page = 1
-    per_page = 100
-
-    while True:
-        attempt = 0
-        while attempt < retries:
-            response = requests.get(f"{trakt_url}?page={page}&limit={per_page}", headers=headers)
-
-            if response.status_code == 200:
-                items = response.json()
-                if not items:
-                    return watchlist_items  # No more items to retrieve
-                watchlist_items.extend(items)
-                print(f"Retrieved page {page} of watchlist...")
-                page += 1
-                break
-            elif response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 1))
-                print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-                time.sleep(retry_after)
-                attempt += 1
-            else:
-                print(f"Failed to retrieve watchlist. Response: {response.status_code} - {response.text}")
-                return []
-
-    return watchlist_items
+    try:
+        return list(client.paginate("/sync/watchlist", "watchlist items"))
+    except TraktError as e:
+        print(f"Failed to retrieve watchlist. Response: {e}")
+        return []
 
 # Function to remove items from Trakt watchlist (including seasons)
-def delete_trakt_watchlist(watchlist_items, access_token, client_id, retries=3):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/watchlist/remove"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def delete_trakt_watchlist(watchlist_items, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     movies = [{"ids": item['movie']['ids']} for item in watchlist_items if item['type'] == 'movie']
     shows = [{"ids": item['show']['ids']} for item in watchlist_items if item['type'] == 'show']
@@ -297,79 +173,39 @@ def delete_trakt_watchlist(watchlist_items, access_token, client_id, retries=3):
 
     print(f"Deleting {len(movies)} movie watchlist items, {len(shows)} show watchlist items, {len(episodes)} episode watchlist items, and {len(seasons)} season watchlist items...")
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            print("Successfully deleted all watchlist items.")
-            return
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to delete watchlist. Response: {response.status_code} - {response.text}")
-            return
+    response = client.post("/sync/watchlist/remove", payload)
+
+    if response.status_code == 200:
+        print("Successfully deleted all watchlist items.")
+    else:
+        print(f"Failed to delete watchlist. Response: {response.status_code} - {response.text}")
 
-    print(f"Failed to delete watchlist after {retries} attempts due to rate limits.")
 
+# Function to delete all personal lists from Trakt
+def delete_all_trakt_lists(access_token, client_id):
+    client = get_client(access_token, client_id)
 
-# Function to delete all personal lists from Trakt with retry mechanism
-def delete_all_trakt_lists(access_token, client_id, retries=3):
     # First, get all the user's lists
-    trakt_url = f"{TRAKT_BASE_URL}/users/me/lists"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    response = client.get("/users/me/lists")
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.get(trakt_url, headers=headers)
-
-        if response.status_code == 200:
-            lists = response.json()
-            if not lists:
-                print("No lists to delete.")
-                return
-
-            # Loop through each list and delete
-            for trakt_list in lists:
-                list_id = trakt_list['ids']['slug']
-                delete_url = f"{TRAKT_BASE_URL}/users/me/lists/{list_id}"
-
-                # Retry loop for deleting a list
-                list_attempt = 0
-                while list_attempt < retries:
-                    delete_response = requests.delete(delete_url, headers=headers)
-
-                    if delete_response.status_code == 204:
-                        print(f"Successfully deleted list: {trakt_list['name']}")
-                        break
-                    elif delete_response.status_code == 429:
-                        retry_after = int(delete_response.headers.get('Retry-After', 1))
-                        print(f"Rate limit exceeded (429) for list {trakt_list['name']}. Waiting {retry_after} seconds before retrying... (Attempt {list_attempt+1}/{retries})")
-                        time.sleep(retry_after)
-                        list_attempt += 1
-                    else:
-                        print(f"Failed to delete list {trakt_list['name']}. Response: {delete_response.status_code} - {delete_response.text}")
-                        break
-
-            return
-        elif response.status_code == 429:
-            retry_after = int(response.headers.get('Retry-After', 1))
-            print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying... (Attempt {attempt+1}/{retries})")
-            time.sleep(retry_after)
-            attempt += 1
-        else:
-            print(f"Failed to retrieve lists. Response: {response.status_code} - {response.text}")
-            return
+    if response.status_code != 200:
+        print(f"Failed to retrieve lists. Response: {response.status_code} - {response.text}")
+        return
+
+    lists = response.json()
+    if not lists:
+        print("No lists to delete.")
+        return
+
+    # Loop through each list and delete
+    for trakt_list in lists:
+        list_id = trakt_list['ids']['slug']
+        delete_response = client.delete(f"/users/me/lists/{list_id}")
 
-    print(f"Failed to retrieve or delete lists after {retries} attempts due to rate limits.")
+        if delete_response.status_code == 204:
+            print(f"Successfully deleted list: {trakt_list['name']}")
+        else:
+            print(f"Failed to delete list {trakt_list['name']}. Response: {delete_response.status_code} - {delete_response.text}")
 
 
 # Main function to run the script
@@ -429,4 +265,6 @@ if __name__ == "__main__":
     else:
         print("Skipping lists deletion.")
 
+    report_endpoints()
+    report_connections()
     print("Process completed.")
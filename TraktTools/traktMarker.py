@@ -1,12 +1,17 @@
-import requests
 import json
 import re
-import time
 from datetime import datetime
 import os
+import sys
 import webbrowser
 
-TRAKT_BASE_URL = 'https://api.trakt.tv'
+# Make the shared helpers in ../Common importable when running this script directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+from httpSession import get_session, report_connections
+from traktClient import TRAKT_BASE_URL, get_client, report_endpoints
+
+# Shared keep-alive session, used directly only for the OAuth token request (API calls go through traktClient)
+session = get_session()
 
 # Function to load or request Trakt Client ID and Secret, storing them in a .json file
 def get_client_credentials():
@@ -51,7 +56,7 @@ def authenticate_trakt():
     }
 
     # Request the access token
-    response = requests.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
+    response = session.post(f"{TRAKT_BASE_URL}/oauth/token", json=token_payload)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -63,26 +68,11 @@ def authenticate_trakt():
         print(f"Error authenticating with Trakt: {response.status_code} - {response.text}")
         exit()
 
-# Function to retry requests on rate limit (429)
-def handle_rate_limit(response):
-    if response.status_code == 429:
-        retry_after = int(response.headers.get('Retry-After', 1))
-        print(f"Rate limit exceeded (429). Waiting {retry_after} seconds before retrying...")
-        time.sleep(retry_after)
-        return True
-    return False
-
 # Function to get the seasons and episode counts for a show from the Trakt API
 def get_seasons_and_episodes(show_id, access_token, client_id):
-    trakt_url = f"{TRAKT_BASE_URL}/shows/{show_id}/seasons"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+    client = get_client(access_token, client_id)
 
-    response = requests.get(trakt_url, headers=headers)
+    response = client.get(f"/shows/{show_id}/seasons")
 
     if response.status_code == 200:
         seasons = response.json()
@@ -95,8 +85,7 @@ def get_seasons_and_episodes(show_id, access_token, client_id):
                 continue  # Skip season 0 (specials)
             
             # Fetch the episode count for the season
-            season_url = f"{TRAKT_BASE_URL}/shows/{show_id}/seasons/{season_number}/episodes"
-            season_response = requests.get(season_url, headers=headers)
+            season_response = client.get(f"/shows/{show_id}/seasons/{season_number}/episodes")
 
             if season_response.status_code == 200:
                 episodes = season_response.json()
@@ -112,14 +101,8 @@ def get_seasons_and_episodes(show_id, access_token, client_id):
         return {}
 
 # Function to mark episodes as watched, season by season up to the last watched episode
-def mark_episodes_watched(show_id, last_season, last_ep, watched_at, access_token, client_id, retries=5):
-    trakt_url = f"{TRAKT_BASE_URL}/sync/history"
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json',
-        'trakt-api-version': '2',
-        'trakt-api-key': client_id
-    }
+def mark_episodes_watched(show_id, last_season, last_ep, watched_at, access_token, client_id):
+    client = get_client(access_token, client_id)
 
     payload = {"shows": [{"ids": {"slug": show_id}, "seasons": []}]}
 
@@ -139,21 +122,12 @@ def mark_episodes_watched(show_id, last_season, last_ep, watched_at, access_toke
     }
     payload["shows"][0]["seasons"].append(season_payload)
 
-    attempt = 0
-    while attempt < retries:
-        response = requests.post(trakt_url, headers=headers, json=payload)
-        
-        if response.status_code == 201:
-            print(f"Successfully marked up to season {last_season}, episode {last_ep} as watched.")
-            return
-        elif handle_rate_limit(response):
-            continue
-        else:
-            print(f"Failed to mark episodes for show. Response: {response.status_code} - {response.text}")
-            break
-
-    if attempt == retries:
-        print(f"Failed after {retries} attempts due to rate limits.")
+    response = client.post("/sync/history", payload)
+    
+    if response.status_code == 201:
+        print(f"Successfully marked up to season {last_season}, episode {last_ep} as watched.")
+    else:
+        print(f"Failed to mark episodes for show. Response: {response.status_code} - {response.text}")
 
 # Function to extract show slug from the Trakt URL
 def extract_show_slug(trakt_url):
@@ -235,4 +209,6 @@ if __name__ == "__main__":
 
         if another_show != 'yes':
             print("All episodes up to the given one have been marked as watched.")
+            report_endpoints()
+            report_connections()
             break  # Exit the loop if the user does not want to continue
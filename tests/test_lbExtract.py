@@ -0,0 +1,122 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+# Make the shared helpers in ../Common importable when running the tests from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Common'))
+import lbExtract
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Saved Letterboxd pages: films/watchlist/list listings, the popular AJAX fragment and film pages
+HTML_FIXTURES = [
+    'films_page.html',
+    'last_page.html',
+    'watchlist_next_only.html',
+    'list_page.html',
+    'popular_ajax.html',
+    'film_movie.html',
+    'film_show.html',
+    'film_no_tmdb.html',
+]
+
+# The extract_* helpers whose output must not depend on the HTML backend
+EXTRACT_FUNCTIONS = [
+    lbExtract.extract_poster_entries,
+    lbExtract.extract_film_links,
+    lbExtract.extract_tmdb_info,
+    lbExtract.extract_last_page,
+    lbExtract.extract_has_next_page,
+]
+
+# Function to read a fixture as the raw bytes the crawl engine hands to the extractors
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+# Function to load a backend, None when its parser isn't installed
+def load_extractor(name):
+    try:
+        return lbExtract.EXTRACTORS[name]()
+    except ImportError:
+        return None
+
+# Function to run every extract_* helper on every fixture with the given backend
+def extract_all(extractor):
+    with mock.patch.object(lbExtract, 'extractor', extractor):
+        return {
+            (name, function.__name__): function(read_fixture(name))
+            for name in HTML_FIXTURES
+            for function in EXTRACT_FUNCTIONS
+        }
+
+class ExtractorParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = load_extractor('soup')
+        if cls.reference is None:
+            raise unittest.SkipTest("beautifulsoup4 isn't installed")
+        cls.expected = extract_all(cls.reference)
+
+    def test_backends_match_soup(self):
+        for backend in ('lxml', 'selectolax'):
+            extractor = load_extractor(backend)
+            with self.subTest(backend=backend):
+                if extractor is None:
+                    self.skipTest(f"{backend} isn't installed")
+                results = extract_all(extractor)
+                for key, expected in self.expected.items():
+                    self.assertEqual(results[key], expected, f"{backend} differs on {key[0]} ({key[1]})")
+
+    # The reference output itself, so the backends can't agree on a wrong (e.g. empty) answer
+    def test_poster_entries(self):
+        self.assertEqual(self.expected['films_page.html', 'extract_poster_entries'], [
+            ('https://letterboxd.com/film/fight-club/', 4.5),
+            ('https://letterboxd.com/film/amelie/', 5.0),
+            ('https://letterboxd.com/film/the-thing/', None),
+            ('https://letterboxd.com/film/paddington-2/', 4.0),
+            ('https://letterboxd.com/film/the-office/', 1.5),
+            ('https://letterboxd.com/film/in-the-mood-for-love/', 0.5),
+        ])
+        self.assertEqual(self.expected['last_page.html', 'extract_poster_entries'], [
+            ('https://letterboxd.com/film/stalker/', 3.5),
+        ])
+        self.assertEqual(len(self.expected['watchlist_next_only.html', 'extract_poster_entries']), 3)
+
+    def test_film_links(self):
+        self.assertEqual(self.expected['list_page.html', 'extract_film_links'], [
+            'https://letterboxd.com/film/parasite-2019/',
+            'https://letterboxd.com/film/fight-club/',
+            'https://letterboxd.com/film/the-office/',
+        ])
+        self.assertEqual(self.expected['popular_ajax.html', 'extract_film_links'], [
+            'https://letterboxd.com/film/anora/',
+            'https://letterboxd.com/film/dune-part-two/',
+            'https://letterboxd.com/film/shogun-2024/',
+        ])
+
+    def test_tmdb_info(self):
+        self.assertEqual(self.expected['film_movie.html', 'extract_tmdb_info'], ('550', 'movie'))
+        self.assertEqual(self.expected['film_show.html', 'extract_tmdb_info'], ('2316', 'show'))
+        self.assertEqual(self.expected['film_no_tmdb.html', 'extract_tmdb_info'], (None, None))
+
+    def test_pagination(self):
+        self.assertEqual(self.expected['films_page.html', 'extract_last_page'], 14)
+        self.assertEqual(self.expected['last_page.html', 'extract_last_page'], 13)
+        self.assertEqual(self.expected['watchlist_next_only.html', 'extract_last_page'], 1)
+        self.assertTrue(self.expected['films_page.html', 'extract_has_next_page'])
+        self.assertTrue(self.expected['watchlist_next_only.html', 'extract_has_next_page'])
+        self.assertFalse(self.expected['last_page.html', 'extract_has_next_page'])
+
+class RssFeedTest(unittest.TestCase):
+    def test_rss_entries(self):
+        nzdt = timezone(timedelta(hours=13))
+        self.assertEqual(lbExtract.extract_rss_entries(read_fixture('rss_feed.xml')), [
+            ('https://letterboxd.com/film/fight-club/', '550', 'movie', 4.5, datetime(2024, 10, 12, 20, 15, 31, tzinfo=nzdt)),
+            ('https://letterboxd.com/film/the-office/', '2316', 'show', None, datetime(2024, 10, 11, 9, 0, tzinfo=nzdt)),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()